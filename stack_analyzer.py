@@ -11,20 +11,78 @@ Key Features:
 - Supports annotations for hard-to-analyze calls (e.g., callbacks) via --add-calls.
 - Analyzes worst-case stack usage and call paths for different scenarios.
 - Reports potentially uncalled functions or dead code (in debug mode).
+- Parses .su and .cgraph files in parallel with a process pool (--jobs).
+- Caches per-file parse results on disk across runs (--cache-dir).
+- Records per-phase wall time, peak memory and counters (--profile, --metrics-json).
+- Reports the N worst paths per entry point (--top) and writes JSON results (--json-output).
+- Provides a StackAnalyzer library API and a resident JSON query server (--serve).
+- Re-analyzes incrementally whenever the build changes the input files (--watch).
+- Derives frame sizes from ELF call frame information, cross-checked against .su (--elf-frames).
+- Ranks the largest stack frames per function, file, directory and qualifier (--rank-frames).
+- Analyzes several build variants from a manifest, parsing shared files once (--batch).
+- Saves baseline snapshots and reports stack growth against them (--save-snapshot, --compare-to).
+- Reads .su and .cgraph files straight from .tar(.gz/.xz/.zst) and .zip build archives.
 """
 
+import io
 import os
 import re
+import sys
+import mmap
+import stat
+import signal
+import pickle
+import multiprocessing
+import json
+import zlib
+import time
+import heapq
+import operator
+import hashlib
 import argparse
-from collections import defaultdict
+import tracemalloc
+import socketserver
+import tarfile
+import zipfile
+from array import array
+from collections import defaultdict, deque
+from contextlib import contextmanager, redirect_stdout
+from itertools import chain, compress, repeat
+from concurrent.futures import ProcessPoolExecutor
 from elftools.elf.elffile import ELFFile
 from elftools.elf.sections import SymbolTableSection
+from elftools.dwarf.callframe import FDE
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+try:
+    import zstandard
+except ImportError:  # Only needed for .tar.zst archives
+    zstandard = None
 
 # --- Constants ---
-CGRAPH_SYMBOL_DEF_RE = re.compile(r"^([\w\d_.-]+)/(\d+)\s+\(([\w\d_.-]+)\)")
-CGRAPH_CALLS_LINE_RE = re.compile(r"^\s*Calls:\s*(.*)")
+NEWLINE_RE = re.compile(rb"\n")
+# A symbol header ('name/id (actual_name)') or a 'Calls:' line of a cgraph dump. The leading
+# newline lets the regex engine skip from line start to line start instead of trying every byte.
+_CGRAPH_ENTRY_PATTERN = rb"([\w.-]+/\d+)[ \t]+\(([\w.-]+)\)|[ \t]*Calls:[ \t]*([^\n]*)"
+CGRAPH_ENTRY_RE = re.compile(rb"\n(?:" + _CGRAPH_ENTRY_PATTERN + rb")")
+CGRAPH_FIRST_ENTRY_RE = re.compile(_CGRAPH_ENTRY_PATTERN)
+# Clone suffixes such as '.constprop.0', stripped from newline-separated names.
+CGRAPH_NAME_SUFFIX_RE = re.compile(rb"\.[^\n]*")
+# A .su line ('file:line:column:function<TAB>size<TAB>qualifier'), or any other non-blank line.
+SU_LINE_RE = re.compile(
+    rb"^[ \t]*(?:[^\s:]*:[^\s:]*:[^\s:]*:([^\s:]*)\S*[ \t]+(\d+)(?![^\s])[ \t]*(\S*)[^\n]*|(\S[^\n]*))",
+    re.MULTILINE
+)
+ARCHIVE_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.xz', '.txz', '.tar.zst', '.tzst', '.zip')
 VECTOR_TABLE_SKIP_BYTES = 4  # Skip Main Stack Pointer (MSP)
 VECTOR_ADDR_SIZE_BYTES = 4
+# Bump whenever the per-file parse results change shape, to invalidate old caches.
+PARSE_CACHE_VERSION = 5
+SNAPSHOT_MAGIC = b"STACKSNAP"
+SNAPSHOT_VERSION = 3
 # ANSI escape codes for colored terminal output
 COLOR_BRIGHT_YELLOW = "\033[93m"
 COLOR_RED = "\033[91m"
@@ -33,6 +91,10 @@ COLOR_RESET = "\033[0m"
 # --- Global Variables ---
 # A list to collect warnings to be displayed at the end of the analysis.
 g_deferred_warnings = []
+# Parse results shared by the variants of a batch analysis: {(kind, content_digest): parse_result}.
+g_batch_parse_results = {}
+# The inputs of the scenario analysis, inherited by forked scenario workers.
+g_scenario_context = None
 
 
 # --- Helper Functions ---
@@ -49,47 +111,616 @@ def _validate_file_path(filepath):
         exit(1)
 
 
+def _data_digest(data):
+    """Returns a hash of file content."""
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def _file_digest(filepath):
+    """Returns a hash of a file's content."""
+    with open(filepath, 'rb') as f:
+        return _data_digest(f.read())
+
+
+def _get_stack_size(func, stack_usage):
+    """Returns the frame size of a function, falling back to its normalized name."""
+    return stack_usage.get(func, stack_usage.get(func.split('.')[0], 0))
+
+
+# --- Metrics ---
+def _get_peak_rss_kb(who):
+    """Returns the peak resident set size in KiB, or None if it is not available."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    return peak // 1024 if os.uname().sysname == 'Darwin' else peak  # bytes on macOS
+
+
+class Metrics:
+    """
+    Wall time and peak memory per analysis phase, plus named counters.
+
+    Counters are cheap integer increments and always collected. The OS only
+    reports the peak RSS of the whole process so far, so every phase records
+    that cumulative peak and how much the phase itself raised it. The Python
+    heap peak of each phase on its own is only traced with --profile, since
+    tracemalloc slows the analysis down considerably.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = defaultdict(int)
+        self.scenario_seconds = {}
+        self.trace_memory = False
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    @contextmanager
+    def phase(self, name):
+        """Measures the enclosed block as the phase 'name'."""
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        peak_rss_before = _get_peak_rss_kb(resource.RUSAGE_SELF) if resource is not None else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            phase = {"wall_seconds": round(time.perf_counter() - start, 6)}
+            if resource is not None:
+                phase["process_peak_rss_kb"] = _get_peak_rss_kb(resource.RUSAGE_SELF)
+                phase["process_peak_rss_children_kb"] = _get_peak_rss_kb(resource.RUSAGE_CHILDREN)
+                phase["peak_rss_increase_kb"] = phase["process_peak_rss_kb"] - peak_rss_before
+            if self.trace_memory:
+                phase["peak_python_heap_kb"] = tracemalloc.get_traced_memory()[1] // 1024
+            self.phases[name] = phase
+
+    def to_dict(self):
+        return {
+            "phases": self.phases,
+            "counters": dict(sorted(self.counters.items())),
+            "scenario_seconds": self.scenario_seconds,
+        }
+
+    def write_json(self, filepath):
+        with open(filepath, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def print_summary(self):
+        header = "=" * 70
+        print(f"\n\n{header}")
+        print("--- Profile ---".center(70))
+        print(f"{header}\n")
+        for name, phase in self.phases.items():
+            memory = ""
+            if phase.get('process_peak_rss_kb'):
+                memory = (f"process peak RSS {phase['process_peak_rss_kb'] / 1024:8.1f} MiB "
+                          f"(+{phase['peak_rss_increase_kb'] / 1024:.1f})")
+            if 'peak_python_heap_kb' in phase:
+                memory += f", heap {phase['peak_python_heap_kb'] / 1024:8.1f} MiB"
+            print(f"  {name:<32} {phase['wall_seconds']:>10.3f} s   {memory}")
+        print()
+        for name, value in sorted(self.counters.items()):
+            print(f"  {name:<32} {value:>10}")
+        if self.scenario_seconds:
+            print()
+            for name, seconds in self.scenario_seconds.items():
+                print(f"  scenario {name:<23} {seconds:>10.3f} s")
+
+
+# Phase timings and counters of the current run (see --profile and --metrics-json).
+g_metrics = Metrics()
+
+
+# --- Parse Cache ---
+class ParseCache:
+    """
+    An on-disk cache of per-file parse results.
+
+    Entries are keyed by the absolute file path and validated against the
+    file's mtime and size, or against a content hash when 'use_hash' is set
+    (which also survives rebuilds that only touch timestamps).
+    """
+
+    def __init__(self, cache_dir, kind, use_hash=False):
+        self.cache_file = os.path.join(cache_dir, f"{kind}.cache")
+        self.use_hash = use_hash
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file, 'rb') as f:
+                version, entries = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            print(f"{COLOR_BRIGHT_YELLOW}[Warning] Ignoring unreadable parse cache '{self.cache_file}': {e}{COLOR_RESET}")
+            return
+        if version == PARSE_CACHE_VERSION:
+            self.entries = entries
+
+    def _file_identity(self, filepath):
+        st = os.stat(filepath)
+        return st.st_mtime_ns, st.st_size, _file_digest(filepath) if self.use_hash else None
+
+    def lookup(self, filepath):
+        """Returns (identity, cached_result), cached_result being None on a miss."""
+        identity = self._file_identity(filepath)
+        entry = self.entries.get(os.path.abspath(filepath))
+        if entry is not None:
+            (mtime_ns, size, digest), result = entry
+            if self.use_hash and digest is not None:
+                is_valid = (size, digest) == identity[1:]
+            else:
+                is_valid = (mtime_ns, size) == identity[:2]
+            if is_valid:
+                self.hits += 1
+                return identity, result
+        self.misses += 1
+        return identity, None
+
+    def store(self, filepath, identity, result):
+        self.entries[os.path.abspath(filepath)] = (identity, result)
+
+    def evict_deleted(self):
+        """Drops the entries of files that no longer exist."""
+        for path in [path for path in self.entries if not os.path.exists(path)]:
+            del self.entries[path]
+            self.evicted += 1
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_file) or '.', exist_ok=True)
+        tmp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump((PARSE_CACHE_VERSION, self.entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.cache_file)
+
+
+# --- Call Graph Representation ---
+class CallGraph:
+    """
+    A compact call graph with function names interned to integer IDs.
+
+    The callees of function 'i' are targets[offsets[i]:offsets[i + 1]]
+    (CSR layout), and stack_sizes[i] is its frame size. Callees are returned
+    as memoryview slices, so walking the graph does not allocate new lists.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.ids = {}
+        self.offsets = array('q', [0])
+        self.targets = array('i')
+        self.stack_sizes = array('q')
+        self._targets_view = memoryview(self.targets)
+        self._stack_usage = {}
+        self._callers = None
+
+    @classmethod
+    def from_edges(cls, edges):
+        """Builds a graph from (caller, callee) name pairs, dropping duplicate edges."""
+        graph = cls()
+        callers, callees = array('i'), array('i')
+        for caller, callee in edges:
+            callers.append(graph.intern(caller))
+            callees.append(graph.intern(callee))
+        graph.offsets, graph.targets = _build_csr(len(graph.names), callers, callees, dedupe=True)
+        graph._targets_view = memoryview(graph.targets)
+        return graph
+
+    @classmethod
+    def from_mapping(cls, call_graph):
+        """Builds a graph from a {caller: [callee]} mapping."""
+        return cls.from_edges((caller, callee) for caller, callees in call_graph.items() for callee in callees)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def intern(self, name):
+        """Returns the ID of a function, adding it (without callees) if it is new."""
+        func_id = self.ids.get(name)
+        if func_id is None:
+            func_id = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.offsets.append(self.offsets[-1])
+            self.stack_sizes.append(_get_stack_size(name, self._stack_usage))
+        return func_id
+
+    def load_stack_usage(self, stack_usage):
+        """Sets the frame size of every function from a {function_name: stack_size} table."""
+        self._stack_usage = stack_usage
+        self.stack_sizes = array('q', (_get_stack_size(name, stack_usage) for name in self.names))
+
+    def callees(self, func_id):
+        return self._targets_view[self.offsets[func_id]:self.offsets[func_id + 1]]
+
+    def callers(self, func_id):
+        """Returns the callers of a function, from a reverse graph built on first use."""
+        if self._callers is None:
+            callees = self.targets
+            callers = array('i', bytes(callees.itemsize * len(callees)))
+            for func in range(len(self.names)):
+                for index in range(self.offsets[func], self.offsets[func + 1]):
+                    callers[index] = func
+            offsets, targets = _build_csr(len(self.names), callees, callers, dedupe=False)
+            self._callers = (offsets, memoryview(targets))
+        offsets, targets = self._callers
+        if func_id + 1 >= len(offsets):  # Local to a scenario analysis, so it has no callers in the graph.
+            return targets[0:0]
+        return targets[offsets[func_id]:offsets[func_id + 1]]
+
+    def stack_size(self, name):
+        """Returns the frame size of a function by name."""
+        func_id = self.ids.get(name)
+        return self.stack_sizes[func_id] if func_id is not None else _get_stack_size(name, self._stack_usage)
+
+    def caller_count(self):
+        """Returns the number of functions that call at least one function."""
+        offsets = self.offsets
+        return sum(1 for func_id in range(len(self.names)) if offsets[func_id + 1] > offsets[func_id])
+
+    def called_flags(self):
+        """Returns a bytearray in which every statically called function ID is set."""
+        called = bytearray(len(self.names))
+        for callee in self.targets:
+            called[callee] = 1
+        return called
+
+
+def _build_csr(node_count, sources, destinations, dedupe):
+    """
+    Builds CSR (offsets, targets) arrays from parallel source/destination arrays.
+
+    The original edge order is kept within every source; with 'dedupe',
+    repeated edges are dropped.
+    """
+    offsets = array('q', bytes(8 * (node_count + 1)))
+    for source in sources:
+        offsets[source + 1] += 1
+    for index in range(node_count):
+        offsets[index + 1] += offsets[index]
+
+    positions = offsets[:-1]
+    targets = array('i', bytes(4 * len(destinations)))
+    for source, destination in zip(sources, destinations):
+        targets[positions[source]] = destination
+        positions[source] += 1
+
+    if dedupe:
+        write = 0
+        start = 0
+        for source in range(node_count):
+            end = offsets[source + 1]
+            if end - start > 1:
+                seen = set()
+                for index in range(start, end):
+                    target = targets[index]
+                    if target not in seen:
+                        seen.add(target)
+                        targets[write] = target
+                        write += 1
+            elif end > start:
+                targets[write] = targets[start]
+                write += 1
+            offsets[source + 1] = write
+            start = end
+        del targets[write:]
+    return offsets, targets
+
+
 # --- Core Parsing and Graph Building Functions ---
-def parse_su_files(su_dirs, is_debug_mode):
+def _is_su_file(filename):
+    return filename.endswith(".su")
+
+
+def _is_cgraph_file(filename):
+    return ".cgraph" in filename or ".ipa" in filename
+
+
+def _is_archive(path):
+    return path.lower().endswith(ARCHIVE_SUFFIXES) and os.path.isfile(path)
+
+
+def _open_tar_stream(archive_path, f):
+    """Opens a tar archive for one sequential pass over its members."""
+    if archive_path.lower().endswith(('.tar.zst', '.tzst')):
+        if zstandard is None:
+            raise tarfile.ReadError("reading .tar.zst archives requires the 'zstandard' package")
+        return tarfile.open(fileobj=zstandard.ZstdDecompressor().stream_reader(f), mode='r|')
+    return tarfile.open(fileobj=f, mode='r|*')
+
+
+def _iter_archive_members(archive_path, is_wanted_file):
+    """
+    Yields ('archive:member', data) for the wanted files in an archive, without extracting it.
+
+    Tar archives (plain, gzip, xz or zstd compressed) are streamed in a single
+    sequential pass. Zip archives are read member by member from their index.
+    """
+    if archive_path.lower().endswith('.zip'):
+        with zipfile.ZipFile(archive_path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and is_wanted_file(os.path.basename(info.filename)):
+                    yield f"{archive_path}:{info.filename}", archive.read(info)
+        return
+
+    with open(archive_path, 'rb') as f, _open_tar_stream(archive_path, f) as archive:
+        for member in archive:
+            if member.isfile() and is_wanted_file(os.path.basename(member.name)):
+                yield f"{archive_path}:{member.name}", archive.extractfile(member).read()
+
+
+def _iter_input_archives(input_paths, is_wanted_file, is_debug_mode):
+    """Yields ('archive:member', data) for the wanted files in the archives among 'input_paths'."""
+    for input_path in input_paths:
+        if not _is_archive(input_path):
+            continue
+        debug_print(f"  DBG: Streaming archive: {input_path}", is_debug_mode)
+        try:
+            yield from _iter_archive_members(input_path, is_wanted_file)
+        except (tarfile.TarError, zipfile.BadZipFile, OSError) as e:
+            print(f"{COLOR_BRIGHT_YELLOW}[Warning] Could not read archive '{input_path}': {e}{COLOR_RESET}")
+
+
+def _iter_archive_inputs(archive_path, kinds, is_debug_mode):
+    """
+    Yields (kind, 'archive:member', data) for the members of an archive of the
+    given kinds ('su' and/or 'cgraph'), streaming the archive only once.
+    """
+    wanted_kinds = [(kind, is_wanted_file) for kind, is_wanted_file in (("su", _is_su_file), ("cgraph", _is_cgraph_file))
+                    if kind in kinds]
+
+    def is_wanted_file(filename):
+        return any(is_wanted(filename) for _, is_wanted in wanted_kinds)
+
+    for member_path, data in _iter_input_archives([archive_path], is_wanted_file, is_debug_mode):
+        filename = os.path.basename(member_path[len(archive_path) + 1:])
+        for kind, is_wanted in wanted_kinds:
+            if is_wanted(filename):
+                yield kind, member_path, data
+
+
+def _parse_archives(input_paths, is_wanted_file, parse_data_func, is_debug_mode, parsed_archives=None):
+    """
+    Yields ('archive:member', parse_result) for the wanted files in the archives among 'input_paths'.
+
+    The members are parsed as they are streamed, so the archive is never extracted
+    and only one member is held in memory at a time. Archives that are in
+    'parsed_archives' ({archive_path: [('archive:member', parse_result)]}, see
+    parse_input_archives()) are not read again.
+    """
+    for input_path in input_paths:
+        parsed_members = (parsed_archives or {}).get(os.path.abspath(input_path))
+        if parsed_members is not None:
+            yield from parsed_members
+            continue
+        for member_path, data in _iter_input_archives([input_path], is_wanted_file, is_debug_mode):
+            g_metrics.count('archive_members_parsed')
+            yield member_path, parse_data_func(data)
+
+
+def parse_input_archives(su_dirs, cgraph_dirs, is_debug_mode):
+    """
+    Parses the archives given for both .su and cgraph inputs in a single pass each.
+
+    This is the case when --cgraph-dir defaults to --su-dir: each member of
+    the archive goes to the parser of its kind, so the archive is
+    decompressed once rather than once per kind. The results are kept until
+    parse_su_files() and build_base_call_graph_from_cgraph() consume them.
+
+    Returns:
+        tuple: ({archive_path: [('archive:member', su_result)]},
+                {archive_path: [('archive:member', cgraph_result)]}), by absolute archive path.
+    """
+    su_archives = {os.path.abspath(path): path for path in su_dirs if _is_archive(path)}
+    shared_archives = [path for path in dict.fromkeys(map(os.path.abspath, cgraph_dirs)) if path in su_archives]
+    parsed_su_archives, parsed_cgraph_archives = {}, {}
+    for archive_path in shared_archives:
+        su_members = parsed_su_archives[archive_path] = []
+        cgraph_members = parsed_cgraph_archives[archive_path] = []
+        for kind, member_path, data in _iter_archive_inputs(su_archives[archive_path], ("su", "cgraph"),
+                                                            is_debug_mode):
+            g_metrics.count('archive_members_parsed')
+            if kind == "su":
+                su_members.append((member_path, _parse_su_data(data)))
+            else:
+                cgraph_members.append((member_path, _parse_cgraph_data(data)))
+    return parsed_su_archives, parsed_cgraph_archives
+
+
+def _walk_input_files(dirs, is_wanted_file, option_name, is_debug_mode):
+    """
+    Walks a list of directories and returns the matching file paths.
+
+    The paths are returned in walk order, which is the order the results
+    of the per-file parsers are merged in, so that a parallel run produces
+    exactly the same result as a serial one.
+    """
+    filepaths = []
+    for input_dir in dirs:
+        if _is_archive(input_dir):
+            continue  # Read by _parse_archives.
+        if not os.path.isdir(input_dir):
+            print(f"{COLOR_BRIGHT_YELLOW}[Warning] Directory for {option_name} not found, skipping: {input_dir}{COLOR_RESET}")
+            continue
+
+        debug_print(f"  DBG: Walking {option_name} directory: {input_dir}", is_debug_mode)
+        for dirpath, _, filenames in os.walk(input_dir):
+            for filename in filenames:
+                if is_wanted_file(filename):
+                    filepaths.append(os.path.join(dirpath, filename))
+    return filepaths
+
+
+def _map_files(parse_func, filepaths, jobs):
+    """
+    Applies a per-file parser to every file, in a process pool if jobs > 1.
+
+    The results are yielded in the same order as 'filepaths'.
+    """
+    if jobs <= 1 or len(filepaths) < 2:
+        yield from map(parse_func, filepaths)
+        return
+
+    chunksize = max(1, len(filepaths) // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(parse_func, filepaths, chunksize=chunksize)
+
+
+def _parse_files(parse_func, filepaths, jobs, cache, is_debug_mode):
+    """
+    Yields (filepath, parse_result) pairs in 'filepaths' order.
+
+    With a cache, only files that changed since the last run are parsed;
+    the rest are loaded from the cache, and the cache is updated on disk
+    once all results have been consumed.
+    """
+    if cache is None:
+        yield from zip(filepaths, _map_files(parse_func, filepaths, jobs))
+        return
+
+    lookups = [cache.lookup(filepath) for filepath in filepaths]
+    changed_filepaths = [filepath for filepath, (_, result) in zip(filepaths, lookups) if result is None]
+    parsed_results = _map_files(parse_func, changed_filepaths, jobs)
+    for filepath, (identity, result) in zip(filepaths, lookups):
+        if result is None:
+            result = next(parsed_results)
+            cache.store(filepath, identity, result)
+        yield filepath, result
+
+    cache.evict_deleted()
+    cache.save()
+    g_metrics.count('parse_cache_hits', cache.hits)
+    g_metrics.count('parse_cache_misses', cache.misses)
+    debug_print(f"  DBG: Parse cache '{cache.cache_file}': {cache.hits} hit(s), {cache.misses} miss(es), "
+                f"{cache.evicted} evicted.", is_debug_mode)
+
+
+@contextmanager
+def _mapped_file(filepath):
+    """Maps a file read-only into memory (an empty file, which cannot be mapped, yields b'')."""
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+def _count_lines(data):
+    # mmap objects have no count(); findall() still scans in C without copying the data.
+    return len(NEWLINE_RE.findall(data)) + (1 if data[-1:] not in (b'', b'\n') else 0)
+
+
+def _parse_su_file(filepath):
+    """
+    Parses a single .su file.
+
+    The file is read in one call and split as a whole; a well-formed file
+    is sliced into columns without any per-line Python code. Every line of
+    a .su file is kept, so mapping it instead of reading it would save nothing.
+
+    Returns:
+        tuple: ({function_name: max_stack_size}, {function_name: qualifier},
+                [malformed_lines], line_count), where the qualifier is the
+                'static', 'dynamic' or 'dynamic,bounded' of the kept size.
+    """
+    with open(filepath, 'rb') as f:
+        return _parse_su_data(f.read())
+
+
+def _parse_su_data(data):
+    line_count = _count_lines(data)
+    fields = data.split()
+    # Fast path for the usual well-formed file: three fields per line and four colon-separated
+    # parts per location, so every column can be sliced out without a per-line loop.
+    if len(fields) == 3 * line_count:
+        location_fields = fields[0::3]
+        if all(count == 3 for count in map(bytes.count, location_fields, repeat(b':'))):
+            locations = b':'.join(location_fields).split(b':')
+            try:
+                stack_sizes = list(map(int, fields[1::3]))
+            except ValueError:
+                pass
+            else:
+                func_names = b'\n'.join(locations[3::4]).decode('utf-8', 'replace').split('\n')
+                qualifiers = b' '.join(fields[2::3]).decode('ascii', 'replace').split(' ')
+                if len(set(func_names)) == len(func_names):
+                    return dict(zip(func_names, stack_sizes)), dict(zip(func_names, qualifiers)), [], line_count
+                matches = zip(func_names, stack_sizes, qualifiers, [None] * line_count)
+                return (*_merge_su_entries(matches), line_count)
+
+    matches = ((func_name.decode('utf-8', 'replace'), int(stack_size), qualifier.decode('ascii', 'replace'), None)
+               if other_line is None else (None, None, None, other_line)
+               for func_name, stack_size, qualifier, other_line in
+               (match.groups() for match in SU_LINE_RE.finditer(data)))
+    return (*_merge_su_entries(matches), line_count)
+
+
+def _merge_su_entries(entries):
+    """Keeps the largest size of every function from (function, size, qualifier, other_line) entries."""
+    file_stack_usage = {}
+    file_qualifiers = {}
+    malformed_lines = []
+    for func_name, stack_size, qualifier, other_line in entries:
+        if other_line is not None:
+            # Lines with a single field are skipped silently, like blank lines.
+            if len(other_line.split()) >= 2:
+                malformed_lines.append(other_line.strip().decode('utf-8', 'replace'))
+            continue
+        if func_name not in file_stack_usage or stack_size > file_stack_usage[func_name]:
+            file_stack_usage[func_name] = stack_size
+            file_qualifiers[func_name] = qualifier
+    return file_stack_usage, file_qualifiers, malformed_lines
+
+
+def parse_su_files(su_dirs, is_debug_mode, jobs=1, cache=None, stack_qualifiers=None, parsed_archives=None):
     """
     Recursively parses .su files from a list of directories.
 
     Args:
-        su_dirs (list): A list of directories containing .su files.
+        su_dirs (list): A list of directories or archives containing .su files.
         is_debug_mode (bool): Flag to enable debug output.
+        jobs (int): Number of worker processes used to parse the (non-archived) files.
+        cache (ParseCache, optional): Cache of previously parsed files.
+        stack_qualifiers (dict, optional): Filled with {function_name: qualifier}
+            ('static', 'dynamic' or 'dynamic,bounded') of the returned sizes.
+        parsed_archives (dict, optional): Archives already parsed by parse_input_archives().
 
     Returns:
         dict: A dictionary of {function_name: stack_size}.
     """
     stack_usage = {}
-    total_files_processed = 0
-
-    for su_dir in su_dirs:
-        if not os.path.isdir(su_dir):
-            print(f"{COLOR_BRIGHT_YELLOW}[Warning] Directory for --su-dir not found, skipping: {su_dir}{COLOR_RESET}")
-            continue
-
-        debug_print(f"  DBG: Walking SU directory: {su_dir}", is_debug_mode)
-        
-        for dirpath, _, filenames in os.walk(su_dir):
-            for filename in filenames:
-                if filename.endswith(".su"):
-                    total_files_processed += 1
-                    filepath = os.path.join(dirpath, filename)
-                    debug_print(f"    -> Parsing .su file ({total_files_processed}): {filepath}", is_debug_mode)
-                    with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                        for line in f:
-                            try:
-                                parts = line.strip().split()
-                                if len(parts) >= 2:
-                                    func_name = parts[0].split(':')[3]
-                                    stack_size = int(parts[1])
-                                    if func_name not in stack_usage or stack_size > stack_usage[func_name]:
-                                        stack_usage[func_name] = stack_size
-                            except (IndexError, ValueError):
-                                print(f"  [Warning] Skipping malformed line in '{filepath}': '{line.strip()}'")
-
-    debug_print(f"  DBG: Processed a total of {total_files_processed} .su files.", is_debug_mode)
+    filepaths = _walk_input_files(su_dirs, _is_su_file, "--su-dir", is_debug_mode)
+
+    results = chain(_parse_files(_parse_su_file, filepaths, jobs, cache, is_debug_mode),
+                    _parse_archives(su_dirs, _is_su_file, _parse_su_data, is_debug_mode, parsed_archives))
+    line_count = malformed_line_count = file_count = 0
+    for file_count, (filepath, file_result) in enumerate(results, 1):
+        file_stack_usage, file_qualifiers, malformed_lines, file_line_count = file_result
+        if is_debug_mode:
+            print(f"    -> Parsing .su file ({file_count}): {filepath}")
+        line_count += file_line_count
+        malformed_line_count += len(malformed_lines)
+        for line in malformed_lines:
+            print(f"  [Warning] Skipping malformed line in '{filepath}': '{line}'")
+        for func_name, stack_size in file_stack_usage.items():
+            if func_name not in stack_usage or stack_size > stack_usage[func_name]:
+                stack_usage[func_name] = stack_size
+                if stack_qualifiers is not None:
+                    stack_qualifiers[func_name] = file_qualifiers[func_name]
+
+    g_metrics.count('su_files_walked', file_count)
+    g_metrics.count('su_lines_parsed', line_count)
+    g_metrics.count('su_malformed_lines', malformed_line_count)
+    debug_print(f"  DBG: Processed a total of {file_count} .su files.", is_debug_mode)
     return stack_usage
 
 
@@ -116,196 +747,736 @@ def load_annotation_file(filepath):
     return annotation_set
 
 
-def build_base_call_graph_from_cgraph(cgraph_dirs, ignore_set, is_debug_mode):
+def _parse_cgraph_file(filepath):
     """
-    Builds the base call graph from a list of cgraph directories.
-    """
-    symbol_map = {}
-    temp_call_relations = defaultdict(list)
-    any_cgraph_files_found = False
-    total_files_processed = 0
+    Parses a single .cgraph/.ipa dump and resolves its calls.
 
-    for cgraph_dir in cgraph_dirs:
-        if not os.path.isdir(cgraph_dir):
-            print(f"{COLOR_BRIGHT_YELLOW}[Warning] Directory for --cgraph-dir not found, skipping: {cgraph_dir}{COLOR_RESET}")
-            continue
+    The dump is memory-mapped and scanned as a whole, jumping straight from
+    one symbol header or 'Calls:' line to the next; only the names that are
+    kept are decoded.
 
-        debug_print(f"  DBG: Walking cgraph directory: {cgraph_dir}", is_debug_mode)
-        current_caller_name_in_file = None
-        
-        for dirpath, _, filenames in os.walk(cgraph_dir):
-            for filename in filenames:
-                if ".cgraph" not in filename and ".ipa" not in filename:
-                    continue
+    GCC's numeric symbol IDs are only unique within one translation unit, so
+    the callee symbols are resolved against this file's own symbol table.
+    Only the resolved, normalized call edges are returned.
 
-                any_cgraph_files_found = True
-                total_files_processed += 1
-                filepath = os.path.join(dirpath, filename)
-                
-                debug_print(f"    -> Processing cgraph file ({total_files_processed}): {filepath}", is_debug_mode)
-
-                with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
-                    for line in f:
-                        symbol_match = CGRAPH_SYMBOL_DEF_RE.match(line)
-                        if symbol_match:
-                            name_with_id, num_id, actual_name = symbol_match.groups()
-                            symbol_map[f"{name_with_id}/{num_id}"] = actual_name
-                            current_caller_name_in_file = actual_name
-                            continue
-                        if current_caller_name_in_file:
-                            calls_match = CGRAPH_CALLS_LINE_RE.match(line)
-                            if calls_match:
-                                temp_call_relations[current_caller_name_in_file].extend(calls_match.group(1).split())
-                                current_caller_name_in_file = None
+    Returns:
+        tuple: ([(caller, callee)], [(caller, unresolved_callee_symbol)], line_count)
+    """
+    with _mapped_file(filepath) as data:
+        return _parse_cgraph_data(data)
+
+
+def _parse_cgraph_data(data):
+    entries = CGRAPH_ENTRY_RE.findall(data)
+    first_entry = CGRAPH_FIRST_ENTRY_RE.match(data)
+    if first_entry:
+        entries.insert(0, first_entry.groups(b''))
+    if not entries:
+        return [], [], _count_lines(data)
+
+    # Every step below works on whole columns, so no Python code runs per line.
+    # 'Calls:' entries have an empty symbol and name.
+    symbols, actual_names, calls = zip(*entries)
+    names = CGRAPH_NAME_SUFFIX_RE.sub(b'', b'\n'.join(actual_names)).decode('ascii').split('\n')
+    is_header = list(map(bool, symbols))
+    symbol_map = dict(zip(compress(symbols, is_header), compress(names, is_header)))
+
+    # A 'Calls:' line belongs to the symbol header right before it. Symbols may be referenced
+    # before they are defined, so the calls are resolved once the whole dump is read.
+    has_calls = list(map(operator.and_, is_header, map(operator.not_, is_header[1:])))
+    callee_symbol_lists = list(map(bytes.split, compress(calls[1:], has_calls)))
+    callee_symbols = list(chain.from_iterable(callee_symbol_lists))
+    caller_names = list(chain.from_iterable(map(repeat, compress(names, has_calls), map(len, callee_symbol_lists))))
+    callee_names = list(map(symbol_map.get, callee_symbols))
+
+    unresolved = []
+    if None in callee_names:
+        is_resolved = list(map(operator.is_not, callee_names, repeat(None)))
+        is_unresolved = list(map(operator.not_, is_resolved))
+        unresolved_symbols = b'\n'.join(compress(callee_symbols, is_unresolved)).decode('utf-8', 'replace')
+        unresolved = list(zip(compress(caller_names, is_unresolved), unresolved_symbols.split('\n')))
+        caller_names = compress(caller_names, is_resolved)
+        callee_names = compress(callee_names, is_resolved)
+    call_edges = dict.fromkeys(zip(caller_names, callee_names))
+    return list(call_edges), unresolved, _count_lines(data)
+
+
+def build_base_call_graph_from_cgraph(cgraph_dirs, ignore_set, is_debug_mode, jobs=1, cache=None,
+                                      parsed_archives=None):
+    """
+    Builds the base call graph (a CallGraph) from a list of cgraph directories.
+
+    The files are streamed: each file's resolved edges are added to the graph
+    as soon as it is parsed, so the raw dumps are never held all at once.
+    Archives in 'parsed_archives' (see parse_input_archives()) are not read again.
+    """
+    filepaths = _walk_input_files(cgraph_dirs, _is_cgraph_file, "--cgraph-dir", is_debug_mode)
+    unresolved_report = []
+    edge_count = line_count = file_count = 0
+
+    def iter_call_edges():
+        nonlocal edge_count, line_count, file_count
+        results = chain(_parse_files(_parse_cgraph_file, filepaths, jobs, cache, is_debug_mode),
+                        _parse_archives(cgraph_dirs, _is_cgraph_file, _parse_cgraph_data, is_debug_mode,
+                                        parsed_archives))
+        for file_count, (filepath, (call_edges, unresolved, file_line_count)) in enumerate(results, 1):
+            if is_debug_mode:
+                print(f"    -> Processing cgraph file ({file_count}): {filepath}")
+            line_count += file_line_count
+            unresolved_report.extend(unresolved)
+            for call_edge in call_edges:
+                if call_edge not in ignore_set:
+                    edge_count += 1
+                    yield call_edge
+
+    call_graph = CallGraph.from_edges(iter_call_edges())
+    any_cgraph_files_found = file_count > 0
 
     if not any_cgraph_files_found:
         dirs_str = ', '.join(cgraph_dirs)
         msg = (f"{COLOR_BRIGHT_YELLOW}[Warning] No .cgraph or .ipa files found in specified directories: {dirs_str}\n"
                f"   To generate them, the project must be built with the '-fdump-ipa-cgraph' compiler option.{COLOR_RESET}")
         g_deferred_warnings.append(msg)
-    
-    debug_print(f"  DBG: Processed a total of {total_files_processed} cgraph/ipa files.", is_debug_mode)
-    debug_print(f"  DBG: Symbol map built with {len(symbol_map)} entries.", is_debug_mode)
-
-    call_graph = defaultdict(list)
-    unresolved_report = []
-    for caller_name, callee_symbols in temp_call_relations.items():
-        caller_normalized = caller_name.split('.')[0]
-        for callee_symbol in callee_symbols:
-            actual_callee_name = symbol_map.get(callee_symbol)
-            if actual_callee_name:
-                callee_normalized = actual_callee_name.split('.')[0]
-                if (caller_normalized, callee_normalized) not in ignore_set:
-                    if callee_normalized not in call_graph[caller_normalized]:
-                        call_graph[caller_normalized].append(callee_normalized)
-            else:
-                unresolved_report.append((caller_normalized, callee_symbol))
 
+    g_metrics.count('cgraph_files_walked', file_count)
+    g_metrics.count('cgraph_lines_parsed', line_count)
+    g_metrics.count('edges_resolved', edge_count)
+    g_metrics.count('edges_unresolved', len(unresolved_report))
+    debug_print(f"  DBG: Processed a total of {file_count} cgraph/ipa files.", is_debug_mode)
+    debug_print(f"  DBG: Resolved {edge_count} call edge(s), {len(unresolved_report)} unresolved.", is_debug_mode)
     debug_print("  DBG: Finished cgraph processing.", is_debug_mode)
     return call_graph, unresolved_report, any_cgraph_files_found
 
 
-def get_isr_entry_points(elf_file, vector_table_name, is_debug_mode):
-    """Extracts ISR entry points from the ELF file's vector table."""
+class ElfSymbolIndex:
+    """
+    Lookup indexes over an ELF symbol table, built in a single pass.
+
+    - functions_by_address: {address: function_name} for STT_FUNC symbols. The
+      Thumb bit is cleared, so the addresses match vector table entries.
+    - symbols_by_name: {symbol_name: Symbol}, keeping the first symbol of a name.
+    """
+
+    def __init__(self, elffile):
+        self.functions_by_address = {}
+        self.symbols_by_name = {}
+        symtab = elffile.get_section_by_name('.symtab')
+        self.has_symtab = isinstance(symtab, SymbolTableSection)
+        if not self.has_symtab:
+            return
+
+        for sym in symtab.iter_symbols():
+            self.symbols_by_name.setdefault(sym.name, sym)
+            if sym['st_info']['type'] == 'STT_FUNC':
+                self.functions_by_address.setdefault(sym['st_value'] & ~1, sym.name)
+
+    def symbol(self, name):
+        """Returns the symbol with the given name, or None."""
+        return self.symbols_by_name.get(name)
+
+    def function_at(self, address):
+        """Returns the name of the function at an address (Thumb bit ignored), or None."""
+        return self.functions_by_address.get(address & ~1)
+
+
+def load_elf_symbol_index(elf_file):
+    """
+    Loads the symbol indexes of an ELF file, to share between the readers of its
+    vector table and call frame information. Returns None if it cannot be read,
+    in which case each reader reports the problem itself.
+    """
+    try:
+        with open(elf_file, 'rb') as f:
+            return ElfSymbolIndex(ELFFile(f))
+    except Exception:
+        return None
+
+
+def get_isr_entry_points(elf_file, vector_table_name, is_debug_mode, symbol_index=None):
+    """
+    Extracts ISR entry points from the ELF file's vector table.
+
+    An already loaded ElfSymbolIndex can be passed in to avoid reading the
+    symbol table again.
+    """
     entry_points = set()
     try:
         with open(elf_file, 'rb') as f:
             elffile = ELFFile(f)
-            symtab = elffile.get_section_by_name('.symtab')
-            if not isinstance(symtab, SymbolTableSection):
+            if symbol_index is None:
+                symbol_index = ElfSymbolIndex(elffile)
+            if not symbol_index.has_symtab:
                 debug_print("  DBG: No symbol table in ELF for ISRs.", is_debug_mode)
                 return []
 
-            vector_symbols = [s for s in symtab.iter_symbols() if s.name == vector_table_name]
-            if not vector_symbols:
+            vector_symbol = symbol_index.symbol(vector_table_name)
+            if vector_symbol is None:
                 debug_print(f"  DBG: Vector table symbol '{vector_table_name}' not in ELF.", is_debug_mode)
                 return []
 
-            vector_section = elffile.get_section(vector_symbols[0]['st_shndx'])
+            vector_section = elffile.get_section(vector_symbol['st_shndx'])
             vector_data = vector_section.data()
-            table_offset = vector_symbols[0]['st_value'] - vector_section['sh_addr']
-
-            for i in range(VECTOR_TABLE_SKIP_BYTES, len(vector_data) - table_offset, VECTOR_ADDR_SIZE_BYTES):
-                addr_bytes = vector_data[table_offset + i : table_offset + i + VECTOR_ADDR_SIZE_BYTES]
-                addr = int.from_bytes(addr_bytes, 'little')
+            table_offset = vector_symbol['st_value'] - vector_section['sh_addr']
+            table_end = len(vector_data)
+            if vector_symbol['st_size']:
+                table_end = min(table_end, table_offset + vector_symbol['st_size'])
+            byte_order = 'little' if elffile.little_endian else 'big'
+
+            for i in range(table_offset + VECTOR_TABLE_SKIP_BYTES, table_end, VECTOR_ADDR_SIZE_BYTES):
+                addr = int.from_bytes(vector_data[i : i + VECTOR_ADDR_SIZE_BYTES], byte_order)
                 if addr in (0, 0xFFFFFFFF):
                     continue
-                
-                target_addr = addr & 0xFFFFFFFE
-                for sym in symtab.iter_symbols():
-                    if (sym.entry['st_info']['type'] == 'STT_FUNC' and
-                            sym['st_value'] == target_addr):
-                        entry_points.add(sym.name.split('.')[0])
-                        break
+
+                func_name = symbol_index.function_at(addr)
+                if func_name:
+                    entry_points.add(func_name.split('.')[0])
     except Exception as e:
         print(f"  Error reading ISRs from ELF file: {e}")
     return sorted(list(entry_points))
 
 
+def get_cfi_frame_sizes(elf_file, is_debug_mode, symbol_index=None):
+    """
+    Derives the stack frame size of every function from the ELF's call frame information.
+
+    A function's frame size is the largest CFA offset in its FDE from
+    .debug_frame or .eh_frame, which is the number of bytes it has pushed
+    onto the stack. The ELF is read through a single memory map.
+
+    Once a function moves its CFA to a frame pointer, stack it allocates
+    after that point is not described by the CFI, so its size is only a
+    lower bound. Such functions are returned separately.
+
+    Returns:
+        tuple: ({function_name: frame_size}, {function_name using a frame-pointer CFA})
+    """
+    frame_sizes = {}
+    frame_pointer_functions = set()
+    fde_count = unnamed_fde_count = 0
+    try:
+        with open(elf_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as elf_data:
+            elffile = ELFFile(elf_data)
+            if not elffile.has_dwarf_info():
+                print(f"{COLOR_BRIGHT_YELLOW}[Warning] No call frame information in '{elf_file}'.{COLOR_RESET}")
+                return frame_sizes, frame_pointer_functions
+            if symbol_index is None:
+                symbol_index = ElfSymbolIndex(elffile)
+
+            dwarfinfo = elffile.get_dwarf_info()
+            cfi_entries = []
+            if dwarfinfo.has_CFI():
+                cfi_entries.append(dwarfinfo.CFI_entries())
+            if dwarfinfo.has_EH_CFI():
+                cfi_entries.append(dwarfinfo.EH_CFI_entries())
+
+            for entry in chain.from_iterable(cfi_entries):
+                if not isinstance(entry, FDE):
+                    continue
+                fde_count += 1
+                func_name = symbol_index.function_at(entry['initial_location'])
+                rows = entry.get_decoded().table
+                if not func_name or not rows:
+                    unnamed_fde_count += 1
+                    continue
+
+                # Every function starts with its CFA relative to the stack pointer.
+                stack_pointer = rows[0]['cfa'].reg
+                frame_size = 0
+                for row in rows:
+                    cfa_rule = row['cfa']
+                    if cfa_rule.reg != stack_pointer:
+                        frame_pointer_functions.add(func_name)
+                    if cfa_rule.offset is not None:
+                        frame_size = max(frame_size, cfa_rule.offset)
+                frame_sizes[func_name] = max(frame_size, frame_sizes.get(func_name, 0))
+    except Exception as e:
+        print(f"  Error reading call frame information from ELF file: {e}")
+
+    if not frame_sizes:
+        msg = (f"{COLOR_BRIGHT_YELLOW}[Warning] No frame sizes found in the call frame information of '{elf_file}'.\n"
+               f"   To generate it, build with '-g' or '-fasynchronous-unwind-tables'.{COLOR_RESET}")
+        g_deferred_warnings.append(msg)
+    g_metrics.count('cfi_fdes_parsed', fde_count)
+    debug_print(f"  DBG: Read {fde_count} FDE(s), {unnamed_fde_count} without a function symbol, "
+                f"{len(frame_pointer_functions)} function(s) with a frame-pointer CFA.", is_debug_mode)
+    return frame_sizes, frame_pointer_functions
+
+
+def merge_cfi_frame_sizes(stack_usage, elf_file, is_debug_mode, symbol_index=None):
+    """
+    Adds the ELF-derived frame sizes of the functions missing from the .su data.
+
+    The .su size is kept where both exist, since it also covers stack that
+    the CFI cannot describe; the two are cross-checked and the mismatches
+    are reported.
+
+    Returns:
+        dict: A new dictionary of {function_name: stack_size}.
+    """
+    frame_sizes, frame_pointer_functions = get_cfi_frame_sizes(elf_file, is_debug_mode, symbol_index)
+    mismatches = []
+    for func_name, frame_size in frame_sizes.items():
+        su_size = stack_usage.get(func_name)
+        if su_size is not None and su_size != frame_size:
+            mismatches.append((func_name, su_size, frame_size))
+
+    merged_stack_usage = dict(frame_sizes)
+    merged_stack_usage.update(stack_usage)
+    checked_count = len(frame_sizes.keys() & stack_usage.keys())
+    print(f"   Read {len(frame_sizes)} frame sizes from ELF call frame information "
+          f"({len(frame_sizes) - checked_count} not in .su files).")
+    if stack_usage:
+        print(f"   Cross-checked {checked_count} functions against .su files: {len(mismatches)} mismatch(es).")
+    for func_name, su_size, frame_size in sorted(mismatches):
+        reason = " (frame pointer: CFI size is a lower bound)" if func_name in frame_pointer_functions else ""
+        debug_print(f"  DBG: Frame size mismatch for '{func_name}': .su {su_size}, CFI {frame_size}{reason}",
+                    is_debug_mode)
+    g_metrics.count('cfi_frame_size_mismatches', len(mismatches))
+    return merged_stack_usage
+
+
 # --- Analysis and Reporting Functions ---
+def _find_strongly_connected_components(start_functions, get_callees, is_done):
+    """
+    Finds the strongly connected components reachable from the start functions.
+
+    This is an iterative version of Tarjan's algorithm, so deep call chains do
+    not hit Python's recursion limit. Components are returned in reverse
+    topological order: every callee outside a component is emitted before it.
+    Functions for which 'is_done' is true already have a result and are
+    neither visited nor descended into.
+    """
+    index_of = {}
+    lowlink = {}
+    on_stack = set()
+    scc_stack = []
+    components = []
+
+    for root in start_functions:
+        if root in index_of or is_done(root):
+            continue
+        index_of[root] = lowlink[root] = len(index_of)
+        scc_stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(get_callees(root)))]
+
+        while work:
+            func, callees = work[-1]
+            for callee in callees:
+                if callee not in index_of:
+                    if is_done(callee):
+                        continue
+                    index_of[callee] = lowlink[callee] = len(index_of)
+                    scc_stack.append(callee)
+                    on_stack.add(callee)
+                    work.append((callee, iter(get_callees(callee))))
+                    break
+                if callee in on_stack and index_of[callee] < lowlink[func]:
+                    lowlink[func] = index_of[callee]
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    if lowlink[func] < lowlink[parent]:
+                        lowlink[parent] = lowlink[func]
+                if lowlink[func] == index_of[func]:
+                    component = []
+                    while True:
+                        member = scc_stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == func:
+                            break
+                    components.append(component)
+    return components
+
+
+class _ArrayMap:
+    """A dict-like {function_id: number} map backed by an array, for dense function IDs."""
+
+    def __init__(self, typecode, size, missing):
+        self.values = array(typecode, [missing]) * size
+        self.missing = missing
+
+    def __contains__(self, key):
+        return key < len(self.values) and self.values[key] != self.missing
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def __setitem__(self, key, value):
+        self.reserve(key + 1)
+        self.values[key] = value
+
+    def get(self, key, default=None):
+        return self.values[key] if key in self else default
+
+    def reserve(self, size):
+        """Grows the map to hold keys up to 'size' - 1."""
+        if size > len(self.values):
+            self.values.extend([self.missing] * (size - len(self.values)))
+
+
+class WorstCaseAnalysis:
+    """
+    The worst-case stack results of the functions of a CallGraph.
+
+    Results are computed lazily: the reachable part of the call graph is
+    condensed into strongly connected components, and the worst case of each
+    function is computed once, in a single pass over the resulting DAG, and
+    kept for all later queries. Every function of a recursive component (and
+    every function that can reach one) has an unbounded ('inf') worst case.
+
+    A scenario analysis (see for_scenario()) shares the results of its base
+    analysis and only recomputes the callers affected by its added calls.
+
+    The CallGraph itself is never changed: functions that only appear in the
+    scenario calls get IDs local to the analysis, numbered after those of
+    the graph and of the base analysis.
+    """
+
+    def __init__(self, call_graph, scenario_additions=None, base=None, scenario_removals=None):
+        self.graph = call_graph
+        self.base = base
+        # {function_name: function_id} of the functions that are not in the graph or the base analysis.
+        self.local_ids = {}
+        self._first_local_id = len(base.names) if base is not None else len(call_graph)
+        # {caller_id: [callee_id]} with the base callees, the added ones and without the removed ones.
+        self.merged_callees = {}
+        for caller, callees in (scenario_additions or {}).items():
+            caller_id = self._intern(caller)
+            merged = self.merged_callees.setdefault(caller_id, list(self._graph_callees(caller_id)))
+            merged.extend(self._intern(callee) for callee in callees)
+        for caller, callees in (scenario_removals or {}).items():
+            caller_id = self._id_of(caller)
+            if caller_id is None:  # An unknown function has no calls to remove.
+                continue
+            merged = self.merged_callees.setdefault(caller_id, list(self._graph_callees(caller_id)))
+            removed_ids = {self._id_of(callee) for callee in callees}
+            merged[:] = [callee_id for callee_id in merged if callee_id not in removed_ids]
+        for caller_id, merged in self.merged_callees.items():
+            self.merged_callees[caller_id] = list(dict.fromkeys(merged))  # Remove duplicates
+
+        # Names and frame sizes by function ID, including the local functions.
+        self.names = base.names if base is not None else call_graph.names
+        self.stack_sizes = base.stack_sizes if base is not None else call_graph.stack_sizes
+        if self.local_ids:
+            self.names = self.names + list(self.local_ids)
+            self.stack_sizes = self.stack_sizes + array('q', map(call_graph.stack_size, self.local_ids))
+
+        if base is None:
+            self.affected = None
+            self.component_of = _ArrayMap('i', len(self.names), -1)
+            self.worst_stack = _ArrayMap('d', len(self.names), -1.0)
+            self.worst_callee = _ArrayMap('i', len(self.names), -2)
+        else:
+            # Functions whose worst case can differ from the base analysis.
+            self.affected = self._find_affected_functions()
+            self.component_of, self.worst_stack, self.worst_callee = {}, {}, {}
+        # {component_index: [function_ids]}
+        self.recursive_components = {}
+        self._component_count = 0
+        # Counters for --profile/--metrics-json.
+        self.nodes_visited = 0
+        self.memo_hits = 0
+
+    def for_scenario(self, scenario_additions, scenario_removals=None):
+        """
+        Returns the analysis of this graph with {caller: [callee]} calls added
+        (and, optionally, removed). Call this on a base analysis.
+        """
+        if not scenario_additions and not scenario_removals:
+            return self
+        return WorstCaseAnalysis(self.graph, scenario_additions, base=self, scenario_removals=scenario_removals)
+
+    def stack_from(self, func):
+        """Returns the worst-case stack usage starting at 'func' ('inf' on recursion)."""
+        func_id = self._id_of(func)
+        if func_id is None:  # Neither calls nor is called: just its own frame.
+            return self.graph.stack_size(func)
+        total_stack = self._stack_of(func_id)
+        return int(total_stack) if total_stack != float('inf') else total_stack
+
+    def path_from(self, func):
+        """
+        Returns the worst-case call path starting at 'func'.
+
+        If the path runs into recursion, it ends with the recursive cycle,
+        whose first and last function are the same.
+        """
+        func_id = self._id_of(func)
+        if func_id is None:
+            return [func]
+        names = self.names
+        return [names[func_id] for func_id in self._path_of(func_id)]
+
+    def top_paths(self, func, count):
+        """
+        Returns the 'count' worst distinct call paths starting at 'func', as
+        [(total_stack, path)] sorted from the worst down.
+
+        This is a best-first search over the memoized DAG: a partial path is
+        ranked by its stack so far plus the memoized worst case of its last
+        function, which is exact, so complete paths come out in order and
+        only the branches that can still make the top N are expanded. Ties
+        go to the most recently pushed path, so equal-size frames are
+        followed depth-first to a result instead of expanding every prefix.
+        A function that reaches recursion has just its recursive path.
+        """
+        func_id = self._id_of(func)
+        if func_id is None:
+            return [(self.graph.stack_size(func), [func])][:count]
+        if self._stack_of(func_id) == float('inf'):
+            return [(float('inf'), self.path_from(func))]
+
+        names, stack_sizes = self.names, self.stack_sizes
+        results = []
+        sequence = 0
+        # (-(stack_so_far + worst case of func), -sequence, stack_so_far, func_id, (caller_id, ...) link)
+        heap = [(-self._stack_of(func_id), sequence, 0, func_id, None)]
+        while heap and len(results) < count:
+            _, _, stack_so_far, func_id, parent_link = heapq.heappop(heap)
+            link = (func_id, parent_link)
+            stack_so_far += stack_sizes[func_id]
+            callees = self._callees(func_id)
+            if not len(callees):
+                path = []
+                while link is not None:
+                    path.append(names[link[0]])
+                    link = link[1]
+                path.reverse()
+                results.append((int(stack_so_far), path))
+                continue
+            for callee in callees:
+                sequence += 1
+                heapq.heappush(heap, (-(stack_so_far + self._stack_of(callee)), -sequence, stack_so_far, callee, link))
+        return results
+
+    def recursive_cycles(self, start_functions):
+        """
+        Returns one call cycle (e.g. [a, b, a]) for every recursive component
+        reachable from the start functions.
+        """
+        names = self.names
+        cycles = []
+        seen_components = set()
+        seen = set()
+        start_ids = [func_id for func_id in map(self._id_of, start_functions) if func_id is not None]
+        queue = deque(func_id for func_id in start_ids if self._stack_of(func_id) == float('inf'))
+        while queue:
+            func_id = queue.popleft()
+            if func_id in seen:
+                continue
+            seen.add(func_id)
+            owner = self._owner_of(func_id)
+            component_index = owner.component_of[func_id]
+            if component_index in owner.recursive_components and (id(owner), component_index) not in seen_components:
+                seen_components.add((id(owner), component_index))
+                cycle = owner._find_cycle(min(owner.recursive_components[component_index], key=names.__getitem__))
+                cycles.append([names[member] for member in cycle])
+            # Only callers of a recursion have an 'inf' result, so nothing else needs to be walked.
+            for callee in owner._callees(func_id):
+                if callee not in seen and self._stack_of(callee) == float('inf'):
+                    queue.append(callee)
+        return cycles
+
+    def _id_of(self, name):
+        """Returns the ID of a function, or None if neither the graph nor a scenario call has it."""
+        func_id = self.graph.ids.get(name)
+        analysis = self
+        while func_id is None and analysis is not None:
+            func_id = analysis.local_ids.get(name)
+            analysis = analysis.base
+        return func_id
+
+    def _intern(self, name):
+        """Returns the ID of a function, giving it a local ID if it is new."""
+        func_id = self._id_of(name)
+        if func_id is None:
+            func_id = self.local_ids[name] = self._first_local_id + len(self.local_ids)
+        return func_id
+
+    def _graph_callees(self, func_id):
+        return self.graph.callees(func_id) if func_id < len(self.graph) else ()
+
+    def _callees(self, func_id):
+        merged = self.merged_callees.get(func_id)
+        return merged if merged is not None else self._graph_callees(func_id)
+
+    def _owner_of(self, func_id):
+        """Returns the analysis that holds the result of 'func_id'."""
+        if self.base is not None and func_id < self._first_local_id and func_id not in self.affected:
+            return self.base._owner_of(func_id)
+        return self
+
+    def _stack_of(self, func_id):
+        owner = self._owner_of(func_id)
+        if func_id not in owner.worst_stack:
+            owner._analyze([func_id])
+        else:
+            owner.memo_hits += 1
+        return owner.worst_stack[func_id]
+
+    def _path_of(self, func_id):
+        self._stack_of(func_id)
+        path = []
+        while func_id >= 0:
+            owner = self._owner_of(func_id)
+            if owner is not self:
+                path.extend(owner._path_of(func_id))
+                break
+            worst_callee = self.worst_callee[func_id]
+            if self.worst_stack[func_id] == float('inf') and worst_callee < 0:
+                path.extend(self._find_cycle(func_id))
+                break
+            path.append(func_id)
+            func_id = worst_callee
+        return path
+
+    def _find_affected_functions(self):
+        """
+        Finds the callers of the added or removed calls and all of their ancestors.
+
+        Any other function cannot reach an added call, so its worst case is
+        the same as in the base analysis.
+        """
+        added_callers_of = defaultdict(list)
+        for caller_id, callees in self.merged_callees.items():
+            for callee_id in callees:
+                added_callers_of[callee_id].append(caller_id)
+
+        affected = set(self.merged_callees)
+        queue = deque(affected)
+        while queue:
+            func_id = queue.popleft()
+            for caller_id in chain(self.graph.callers(func_id), added_callers_of.get(func_id, ())):
+                if caller_id not in affected:
+                    affected.add(caller_id)
+                    queue.append(caller_id)
+        return affected
+
+    def _analyze(self, start_ids):
+        """Computes the results of the functions reachable from the start functions."""
+        worst_stack, worst_callee = self.worst_stack, self.worst_callee
+        stack_sizes = self.stack_sizes
+        get_callees = self._callees if self.merged_callees else self.graph.callees
+        memo_hits = 0
+
+        if self.base is None:
+            # Fast path: every result is held in this analysis' own arrays.
+            for array_map in (self.component_of, worst_stack, worst_callee):
+                array_map.reserve(len(self.names))
+            stack_values, missing = worst_stack.values, worst_stack.missing
+
+            def is_done(func_id):
+                nonlocal memo_hits
+                if stack_values[func_id] != missing:
+                    memo_hits += 1
+                    return True
+                return False
+
+            get_stack = stack_values.__getitem__
+            component_of, worst_stack, worst_callee = (
+                self.component_of.values, stack_values, worst_callee.values)
+        else:
+            def is_done(func_id):
+                nonlocal memo_hits
+                if func_id in worst_stack or self._owner_of(func_id) is not self:
+                    memo_hits += 1
+                    return True
+                return False
+
+            get_stack = self._stack_of
+            component_of = self.component_of
+
+        components = _find_strongly_connected_components(start_ids, get_callees, is_done)
+        self.memo_hits += memo_hits
+        for component in components:
+            self.nodes_visited += len(component)
+            component_index = self._component_count
+            self._component_count += 1
+            for func_id in component:
+                component_of[func_id] = component_index
+
+            func_id = component[0]
+            callees = get_callees(func_id)
+            if len(component) > 1 or func_id in callees:
+                self.recursive_components[component_index] = component
+                for member in component:
+                    worst_stack[member] = float('inf')
+                    worst_callee[member] = -1
+                continue
+
+            max_stack_from_callees, worst_callee_id = 0, -1
+            for callee in callees:
+                stack = get_stack(callee)
+                if stack > max_stack_from_callees:
+                    max_stack_from_callees, worst_callee_id = stack, callee
+            worst_stack[func_id] = stack_sizes[func_id] + max_stack_from_callees
+            worst_callee[func_id] = worst_callee_id
+
+    def _find_cycle(self, func_id):
+        """Finds a shortest call cycle from 'func_id' back to itself within its component."""
+        component_index = self.component_of[func_id]
+        parent_of = {}
+        queue = deque([func_id])
+        while queue:
+            caller = queue.popleft()
+            for callee in self._callees(caller):
+                if callee == func_id:
+                    cycle = [func_id]
+                    while caller != func_id:
+                        cycle.append(caller)
+                        caller = parent_of[caller]
+                    cycle.append(func_id)
+                    cycle.reverse()
+                    return cycle
+                if callee not in parent_of and self.component_of.get(callee) == component_index:
+                    parent_of[callee] = caller
+                    queue.append(callee)
+        return [func_id]
+
+
 def find_worst_case_stack_path(start_function, call_graph, stack_usage, scenario_additions=None):
     """
-    DFS(깊이 우선 탐색)를 사용하여 특정 시작 함수로부터 최악의 스택 사용 경로를 찾습니다.
-    이 함수는 메모이제이션(Memoization) 기법을 사용하여 중복 계산을 피해 성능을 최적화합니다.
+    Finds the worst-case stack usage path starting from a specific function.
 
     Args:
-        start_function (str): 분석을 시작할 함수 이름.
-        call_graph (dict): 기본 호출 그래프.
-        stack_usage (dict): 함수별 스택 사용량 정보.
-        scenario_additions (dict, optional): 시나리오별로 추가된 {caller: [callee]} 호출.
+        start_function (str): The function to start the analysis from.
+        call_graph (CallGraph or dict): The base call graph.
+        stack_usage (dict): Stack usage per function.
+        scenario_additions (dict, optional): {caller: [callee]} calls added by a scenario.
 
     Returns:
         tuple: (total_stack, path)
-               - total_stack (float): 최악 경로의 총 스택 사용량. 재귀 시 'inf'.
-               - path (list): 최악 스택 사용량에 해당하는 호출 경로.
-    """
-    # 메모이제이션을 위한 딕셔너리(캐시)입니다.
-    # 한번 계산된 함수의 결과 (최악 스택, 경로)를 저장하여 중복 계산을 방지합니다.
-    memo = {}
-    scenario_additions = scenario_additions or {}
-
-    def get_callees(func):
-        """기본 그래프와 시나리오 추가 호출을 합쳐서 자식 노드(피호출자)를 반환합니다."""
-        base_callees = call_graph.get(func, [])
-        added_callees = scenario_additions.get(func, [])
-        return list(dict.fromkeys(base_callees + added_callees))  # 중복 제거
-
-    def dfs(func, visited_path):
-        """재귀적 깊이 우선 탐색 함수."""
-        # --- [메모이제이션 - 1단계: 결과 확인 및 재사용] ---
-        # 이전에 'func'에 대한 최악 경로를 이미 계산했다면, 저장된 결과를 즉시 반환합니다.
-        # 이를 통해 동일한 함수에 대한 반복적인 경로 탐색을 방지하여 성능을 크게 향상시킵니다.
-        if func in memo:
-            return memo[func]
-
-        # 순환 경로 감지 (현재 탐색 중인 경로에 func이 이미 포함된 경우)
-        if func in visited_path:
-            recursion_path = visited_path[visited_path.index(func):] + [func]
-            return (float('inf'), recursion_path)
-
-        # --- [경로 탐색 및 계산] ---
-        # (이 부분은 func에 대한 결과가 캐시에 없을 때만 실행됩니다)
-        path_with_current = visited_path + [func]
-        max_stack_from_callees, worst_callee_path = 0, []
-
-        for callee in get_callees(func):
-            # 하위 함수(callee)에 대한 최악 경로를 재귀적으로 탐색합니다.
-            stack, path_suffix = dfs(callee, path_with_current)
-            # 가장 스택을 많이 사용하는 하위 경로를 선택합니다.
-            if stack > max_stack_from_callees:
-                max_stack_from_callees = stack
-                worst_callee_path = path_suffix
-
-        # 현재 함수의 스택 크기와 하위 경로의 최대 스택 크기를 더합니다.
-        current_stack = stack_usage.get(func, stack_usage.get(func.split('.')[0], 0))
-        total_stack = current_stack + max_stack_from_callees
-        final_path = [func] + worst_callee_path
-
-        # --- [메모이제이션 - 2단계: 결과 저장] ---
-        # 'func'에 대한 경로 계산이 끝난 후, 그 결과를 'memo' 딕셔너리에 저장합니다.
-        # 키(key)는 함수 이름, 값(value)은 (총 스택, 경로 리스트) 튜플입니다.
-        # 순환 경로('inf')가 아닌 유효한 결과만 저장하여, 다음 번 동일한 'func' 호출 시 재사용할 수 있도록 합니다.
-        if total_stack != float('inf'):
-            memo[func] = (total_stack, final_path)
-            
-        return total_stack, final_path
-
-    # 분석 시작 함수부터 DFS 탐색을 시작합니다.
-    return dfs(start_function, [])
+               - total_stack (float): Total stack usage of the worst path, 'inf' on recursion.
+               - path (list): The call path with the worst stack usage.
+    """
+    if not isinstance(call_graph, CallGraph):
+        call_graph = CallGraph.from_mapping(call_graph)
+    call_graph.load_stack_usage(stack_usage)
+    analysis = WorstCaseAnalysis(call_graph, scenario_additions)
+    return analysis.stack_from(start_function), analysis.path_from(start_function)
 
 
 def _run_uncalled_functions_analysis(stack_usage, base_call_graph, all_scenarios_add_sets, entry_points):
     """Analyzes and reports potentially uncalled functions."""
     print("\n--- Analysis of Potentially Uncalled Functions (Possible Callbacks or Dead Code) ---")
-    all_defined_funcs = {name.split('.')[0] for name in stack_usage.keys()}
-    all_statically_called_funcs = {callee for callees in base_call_graph.values() for callee in callees}
+    called_flags = base_call_graph.called_flags()
     all_manually_added_callees = {
         callee.split('.')[0]
         for add_set in all_scenarios_add_sets.values()
         for _, callee in add_set
     }
     normalized_entry_points = {ep.split('.')[0] for ep in entry_points}
-    uncalled_funcs = all_defined_funcs - all_statically_called_funcs - all_manually_added_callees - normalized_entry_points
+    uncalled_funcs = set()
+    for name in stack_usage.keys():
+        norm_name = name.split('.')[0]
+        func_id = base_call_graph.ids.get(norm_name)
+        if func_id is not None and called_flags[func_id]:
+            continue
+        uncalled_funcs.add(norm_name)
+    uncalled_funcs -= all_manually_added_callees | normalized_entry_points
 
     if uncalled_funcs:
         print(f"  Found {len(uncalled_funcs)} function(s) with stack info that are NOT statically called,")
@@ -324,39 +1495,197 @@ def _run_uncalled_functions_analysis(stack_usage, base_call_graph, all_scenarios
     print("-" * 70)
 
 
-def _run_scenario_analysis(entry_points, base_call_graph, stack_usage, all_scenarios_add_sets, is_debug_mode):
-    """Runs stack analysis for all scenarios and finds the absolute worst case."""
-    overall_worst_stack, overall_worst_path, winning_scenario_name = 0, [], "None (Base)"
-    scenarios_to_run = list(all_scenarios_add_sets.keys()) if all_scenarios_add_sets else [None]
+def _build_path_frames(path, call_graph):
+    """Returns the frames of a call path as [{function, size, cumulative}] for the JSON report."""
+    frames = []
+    cumulative_size = 0
+    for func in path:
+        size = call_graph.stack_size(func)
+        cumulative_size += size
+        frames.append({"function": func, "size": size, "cumulative": cumulative_size})
+    return frames
+
+
+def _stack_to_json(total_stack):
+    """Returns a stack total for the JSON report, None standing for unbounded recursion."""
+    return None if total_stack == float('inf') else int(total_stack)
+
 
-    for scenario_file in scenarios_to_run:
+def _analyze_scenario(base_analysis, entry_points, scenario_file, add_set, is_debug_mode, top_count):
+    """
+    Analyzes all entry points in one scenario, capturing what it prints.
+
+    Returns:
+        dict: The scenario's "report", "worst_stack", "worst_path", printed
+              "output", "seconds" and analysis "counters".
+    """
+    output = io.StringIO()
+    scenario_start = time.perf_counter()
+    with redirect_stdout(output):
         scenario_name = os.path.basename(scenario_file) if scenario_file else 'Base (no callbacks added)'
         print(f"\n--- Analyzing Scenario: {scenario_name} ---")
 
-        add_set = all_scenarios_add_sets.get(scenario_file, set())
         scenario_additions = defaultdict(list)
         if add_set:
             debug_print(f"  DBG: Applying {len(add_set)} manual calls from '{scenario_name}'...", is_debug_mode)
             for caller, callee in add_set:
                 scenario_additions[caller].append(callee)
 
+        analysis = base_analysis.for_scenario(scenario_additions)
+        if analysis is not base_analysis:
+            debug_print(f"  DBG: {len(analysis.affected)} function(s) affected by the added calls.", is_debug_mode)
         scenario_worst_stack, scenario_worst_path = 0, []
+        entry_reports = []
         for start_func in entry_points:
-            total_stack, path = find_worst_case_stack_path(start_func, base_call_graph, stack_usage, scenario_additions)
+            total_stack = analysis.stack_from(start_func)
             if total_stack > scenario_worst_stack:
-                scenario_worst_stack, scenario_worst_path = total_stack, path
-
+                scenario_worst_stack, scenario_worst_path = total_stack, analysis.path_from(start_func)
+            if top_count:
+                top_paths = analysis.top_paths(start_func, top_count)
+            else:
+                top_paths = [(total_stack, analysis.path_from(start_func))]
+            entry_reports.append({
+                "entry_point": start_func,
+                "worst_stack": _stack_to_json(total_stack),
+                "recursive": total_stack == float('inf'),
+                "paths": [
+                    {"total": _stack_to_json(path_stack), "frames": _build_path_frames(path, analysis.graph)}
+                    for path_stack, path in top_paths
+                ],
+            })
+
+        recursive_cycles = []
         if scenario_worst_stack == float('inf'):
             print(f"  Result: Indirect recursion detected.")
             print(f"    Recursive Path: {' -> '.join(scenario_worst_path)}")
+            recursive_cycles = analysis.recursive_cycles(entry_points)
+            print(f"    Found {len(recursive_cycles)} recursive cycle(s):")
+            for cycle in recursive_cycles:
+                print(f"      - {' -> '.join(cycle)}")
         else:
             print(f"  Scenario Worst-case: {int(scenario_worst_stack)} bytes")
 
-        if scenario_worst_stack > overall_worst_stack:
-            overall_worst_stack, overall_worst_path = scenario_worst_stack, scenario_worst_path
-            winning_scenario_name = scenario_name
+        if top_count:
+            _print_top_paths(entry_reports, top_count)
+
+    counters = {}
+    if analysis is not base_analysis:
+        counters = {
+            'functions_affected_by_scenarios': len(analysis.affected),
+            'dfs_nodes_visited': analysis.nodes_visited,
+            'memo_hits': analysis.memo_hits,
+        }
+    return {
+        "report": {
+            "scenario": scenario_name,
+            "scenario_file": scenario_file,
+            "worst_stack": _stack_to_json(scenario_worst_stack),
+            "recursive_cycles": recursive_cycles,
+            "entry_points": entry_reports,
+        },
+        "worst_stack": scenario_worst_stack,
+        "worst_path": scenario_worst_path,
+        "output": output.getvalue(),
+        "seconds": round(time.perf_counter() - scenario_start, 6),
+        "counters": counters,
+    }
+
 
-    return overall_worst_stack, overall_worst_path, winning_scenario_name
+def _analyze_scenario_in_worker(scenario_file):
+    """Analyzes one scenario in a forked worker, reading the analysis inputs inherited from the parent."""
+    base_analysis, entry_points, all_scenarios_add_sets, is_debug_mode, top_count = g_scenario_context
+    return _analyze_scenario(base_analysis, entry_points, scenario_file, all_scenarios_add_sets.get(scenario_file),
+                             is_debug_mode, top_count)
+
+
+def _map_scenarios(base_analysis, entry_points, scenario_files, all_scenarios_add_sets, is_debug_mode, top_count,
+                   jobs):
+    """
+    Yields the result of every scenario, in 'scenario_files' order.
+
+    With jobs > 1 the scenarios run in a pool of forked workers. The workers
+    inherit the base graph and the already computed base results through
+    copy-on-write memory, so only the scenario file names and the results are
+    sent between processes. Where fork is not available, the scenarios run
+    one after another.
+    """
+    worker_count = min(jobs, len(scenario_files))
+    if worker_count <= 1 or 'fork' not in multiprocessing.get_all_start_methods():
+        for scenario_file in scenario_files:
+            yield _analyze_scenario(base_analysis, entry_points, scenario_file,
+                                    all_scenarios_add_sets.get(scenario_file), is_debug_mode, top_count)
+        return
+
+    global g_scenario_context
+    # Compute the base results once, before forking, so that no worker has to redo them.
+    for start_func in entry_points:
+        base_analysis.stack_from(start_func)
+    g_scenario_context = (base_analysis, entry_points, all_scenarios_add_sets, is_debug_mode, top_count)
+    try:
+        with ProcessPoolExecutor(max_workers=worker_count, mp_context=multiprocessing.get_context('fork')) as executor:
+            yield from executor.map(_analyze_scenario_in_worker, scenario_files)
+    finally:
+        g_scenario_context = None
+
+
+def _run_scenario_analysis(entry_points, base_call_graph, all_scenarios_add_sets, is_debug_mode, top_count=0,
+                           jobs=1):
+    """
+    Runs stack analysis for all scenarios and finds the absolute worst case.
+
+    With 'top_count', the worst distinct paths of every entry point are
+    reported as well. With 'jobs' > 1, the scenarios are analyzed in parallel
+    and their results are still printed in order. Returns the overall worst
+    stack, path and scenario name, plus one report dict per scenario for the
+    JSON output.
+    """
+    overall_worst_stack, overall_worst_path, winning_scenario_name = 0, [], "None (Base)"
+    scenarios_to_run = list(all_scenarios_add_sets.keys()) if all_scenarios_add_sets else [None]
+    scenario_reports = []
+    # The base graph results are computed once and shared by all entry points and scenarios.
+    base_analysis = WorstCaseAnalysis(base_call_graph)
+
+    # Entry points stay together within a scenario: they share most of their memoized sub-results.
+    for result in _map_scenarios(base_analysis, entry_points, scenarios_to_run, all_scenarios_add_sets,
+                                 is_debug_mode, top_count, jobs):
+        print(result["output"], end='')
+        scenario_report = result["report"]
+        g_metrics.scenario_seconds[scenario_report["scenario"]] = result["seconds"]
+        for name, value in result["counters"].items():
+            g_metrics.count(name, value)
+        scenario_reports.append(scenario_report)
+
+        if result["worst_stack"] > overall_worst_stack:
+            overall_worst_stack, overall_worst_path = result["worst_stack"], result["worst_path"]
+            winning_scenario_name = scenario_report["scenario"]
+
+    g_metrics.count('dfs_nodes_visited', base_analysis.nodes_visited)
+    g_metrics.count('memo_hits', base_analysis.memo_hits)
+    return overall_worst_stack, overall_worst_path, winning_scenario_name, scenario_reports
+
+
+def _print_top_paths(entry_reports, top_count):
+    """Prints the top N worst paths of every entry point of a scenario."""
+    for entry_report in entry_reports:
+        print(f"  Top {top_count} worst path(s) from '{entry_report['entry_point']}':")
+        for rank, path in enumerate(entry_report["paths"], 1):
+            total = f"{path['total']} bytes" if path["total"] is not None else "recursion"
+            print(f"    #{rank} ({total}): {' -> '.join(frame['function'] for frame in path['frames'])}")
+
+
+def _write_json_report(filepath, worst_stack, worst_path, scenario_name, scenario_reports, call_graph):
+    """Writes the analysis results as a JSON report."""
+    report = {
+        "overall": {
+            "scenario": scenario_name,
+            "worst_stack": _stack_to_json(worst_stack),
+            "recursive": worst_stack == float('inf'),
+            "frames": _build_path_frames(worst_path, call_graph),
+        },
+        "scenarios": scenario_reports,
+    }
+    with open(filepath, 'w') as f:
+        json.dump(report, f, indent=2)
 
 
 def _print_deferred_warnings(warnings):
@@ -370,7 +1699,7 @@ def _print_deferred_warnings(warnings):
             print(warning)
 
 
-def _print_final_results(worst_stack, worst_path, scenario_name, stack_usage):
+def _print_final_results(worst_stack, worst_path, scenario_name, call_graph):
     """Prints the final formatted analysis results."""
     header = "=" * 70
     print(f"\n\n{header}")
@@ -391,48 +1720,1282 @@ def _print_final_results(worst_stack, worst_path, scenario_name, stack_usage):
             cumulative_size = 0
             indent = ""
             for func in worst_path:
-                size = stack_usage.get(func, stack_usage.get(func.split('.')[0], 0))
+                size = call_graph.stack_size(func)
                 cumulative_size += size
                 print(f"{indent}{func} (size: {size}, total: {cumulative_size})")
                 indent += "  "
     print(f"\n{header}")
 
 
+# --- Snapshots ---
+def save_snapshot(filepath, call_graph, stack_usage, scenario_reports):
+    """
+    Writes a compact snapshot of the resolved call graph, frame sizes and worst-case results.
+
+    The graph is stored as the raw bytes of its CSR arrays, and the function
+    names as one newline-separated string, which splits far faster than a
+    list of strings is decoded. The frame sizes are the {function_name: stack_size}
+    table in the same form, so functions without any call edge are kept too.
+    A JSON header holds the section lengths and the worst-case results, so
+    loading a snapshot never unpickles anything. The whole snapshot is
+    zlib-compressed.
+    """
+    sections = {
+        "names": '\n'.join(call_graph.names).encode('utf-8'),
+        "offsets": array('q', call_graph.offsets).tobytes(),
+        "targets": array('i', call_graph.targets).tobytes(),
+        "su_names": '\n'.join(stack_usage).encode('utf-8'),
+        "su_sizes": array('q', stack_usage.values()).tobytes(),
+    }
+    header = json.dumps({
+        "byteorder": sys.byteorder,
+        "sections": [[name, len(section)] for name, section in sections.items()],
+        "results": _snapshot_results(scenario_reports),
+    }).encode('utf-8')
+    data = zlib.compress(b''.join((len(header).to_bytes(4, 'little'), header, *sections.values())), 6)
+    with open(filepath, 'wb') as f:
+        f.write(SNAPSHOT_MAGIC + SNAPSHOT_VERSION.to_bytes(2, 'little') + data)
+
+
+def load_snapshot(filepath):
+    """Loads a snapshot written by save_snapshot, exiting on an unreadable or outdated file."""
+    _validate_file_path(filepath)
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    header_size = len(SNAPSHOT_MAGIC) + 2
+    if not data.startswith(SNAPSHOT_MAGIC):
+        print(f"{COLOR_RED}[Error] Not a stack analyzer snapshot: '{filepath}'{COLOR_RESET}")
+        exit(1)
+    version = int.from_bytes(data[len(SNAPSHOT_MAGIC):header_size], 'little')
+    if version != SNAPSHOT_VERSION:
+        print(f"{COLOR_RED}[Error] Snapshot '{filepath}' has version {version}, expected {SNAPSHOT_VERSION}. "
+              f"Please save it again.{COLOR_RESET}")
+        exit(1)
+    try:
+        data = zlib.decompress(data[header_size:])
+        json_size = int.from_bytes(data[:4], 'little')
+        header = json.loads(data[4:4 + json_size])
+        sections, position = {}, 4 + json_size
+        for name, size in header["sections"]:
+            sections[name] = data[position:position + size]
+            position += size
+
+        def load_array(name, typecode):
+            values = array(typecode)
+            values.frombytes(sections[name])
+            if header["byteorder"] != sys.byteorder:
+                values.byteswap()
+            return values
+
+        names = sections["names"].decode('utf-8').split('\n') if sections["names"] else []
+        su_names = sections["su_names"].decode('utf-8').split('\n') if sections["su_names"] else []
+        snapshot = {
+            "names": names,
+            "offsets": load_array("offsets", 'q'),
+            "targets": load_array("targets", 'i'),
+            "stack_usage": dict(zip(su_names, load_array("su_sizes", 'q'))),
+            "results": {scenario_name: {func: (worst_stack, path) for func, (worst_stack, path) in entries.items()}
+                        for scenario_name, entries in header["results"].items()},
+        }
+    except (zlib.error, ValueError, KeyError, TypeError) as e:
+        print(f"{COLOR_RED}[Error] Corrupt snapshot '{filepath}': {e}{COLOR_RESET}")
+        exit(1)
+    if (len(snapshot["offsets"]) != len(names) + 1 or len(su_names) != len(snapshot["stack_usage"])
+            or min(snapshot["targets"], default=0) < 0 or max(snapshot["targets"], default=-1) >= len(names)):
+        print(f"{COLOR_RED}[Error] Corrupt snapshot '{filepath}': inconsistent call graph.{COLOR_RESET}")
+        exit(1)
+    return snapshot
+
+
+def _snapshot_results(scenario_reports):
+    """Returns {scenario_name: {entry_point: (worst_stack, path)}}; worst_stack is None on recursion."""
+    return {
+        scenario_report["scenario"]: {
+            entry_report["entry_point"]: (
+                entry_report["worst_stack"],
+                [frame["function"] for frame in entry_report["paths"][0]["frames"]] if entry_report["paths"] else [],
+            )
+            for entry_report in scenario_report["entry_points"]
+        }
+        for scenario_report in scenario_reports
+    }
+
+
+def _snapshot_edges(snapshot):
+    names, offsets, targets = snapshot["names"], snapshot["offsets"], snapshot["targets"]
+    return {(names[caller_id], names[targets[i]])
+            for caller_id in range(len(offsets) - 1) for i in range(offsets[caller_id], offsets[caller_id + 1])}
+
+
+def compare_to_snapshot(snapshot, call_graph, stack_usage, scenario_reports, threshold):
+    """
+    Compares the current results with a baseline snapshot.
+
+    Reports the entry points and functions whose stack changed by more than
+    'threshold' bytes (recursion counts as an unbounded change), and the
+    number of call edges added and removed. Entry points of a scenario or
+    entry point that the baseline does not have are reported as new. New and
+    removed functions are compared against a size of 0 bytes.
+
+    Returns:
+        dict: {"entry_points": [...], "functions": [...], "edges_added": int,
+               "edges_removed": int, "regressions": int}, where regressions counts
+               the baseline entry points that grew by more than the threshold.
+    """
+    def exceeds(old_stack, new_stack):
+        if old_stack is None or new_stack is None:
+            return old_stack != new_stack
+        return abs(new_stack - old_stack) > threshold
+
+    entry_changes = []
+    regressions = 0
+    baseline_results = snapshot["results"]
+    for scenario_name, entry_results in _snapshot_results(scenario_reports).items():
+        baseline_entry_results = baseline_results.get(scenario_name, {})
+        for func, (new_stack, new_path) in entry_results.items():
+            is_new = func not in baseline_entry_results
+            old_stack, old_path = baseline_entry_results.get(func, (0, []))
+            if is_new or exceeds(old_stack, new_stack):
+                entry_changes.append({
+                    "scenario": scenario_name, "entry_point": func, "is_new": is_new,
+                    "old_stack": old_stack, "new_stack": new_stack, "old_path": old_path, "new_path": new_path,
+                })
+                if not is_new and (new_stack is None or (old_stack is not None and new_stack - old_stack > threshold)):
+                    regressions += 1
+
+    old_sizes, new_sizes = snapshot["stack_usage"], stack_usage
+    function_changes = []
+    for func in sorted(old_sizes.keys() | new_sizes.keys()):
+        old_size, new_size = old_sizes.get(func), new_sizes.get(func)
+        # A new or removed function counts as growing from or shrinking to 0 bytes.
+        if abs((new_size or 0) - (old_size or 0)) > threshold:
+            function_changes.append({"function": func, "old_size": old_size, "new_size": new_size})
+
+    new_snapshot = {"names": call_graph.names, "offsets": call_graph.offsets, "targets": call_graph.targets}
+    old_edges, new_edges = _snapshot_edges(snapshot), _snapshot_edges(new_snapshot)
+    return {
+        "entry_points": entry_changes,
+        "functions": function_changes,
+        "edges_added": len(new_edges - old_edges),
+        "edges_removed": len(old_edges - new_edges),
+        "regressions": regressions,
+    }
+
+
+def _print_snapshot_comparison(comparison, snapshot_file, threshold):
+    """Prints the changes found by compare_to_snapshot."""
+    def format_stack(stack):
+        return "recursive" if stack is None else f"{stack} bytes"
+
+    header = "=" * 70
+    print(f"\n{header}")
+    print("--- Comparison to Snapshot ---".center(70))
+    print(f"{header}\n")
+    print(f"Baseline: '{snapshot_file}' (threshold: {threshold} bytes)")
+
+    print("\nEntry points:")
+    for change in comparison["entry_points"]:
+        label = f"[{change['scenario']}] {change['entry_point']}"
+        if change["is_new"]:
+            print(f"  {label}: new, not in the baseline ({format_stack(change['new_stack'])})")
+            continue
+        old_stack, new_stack = change["old_stack"], change["new_stack"]
+        delta = f" ({new_stack - old_stack:+d})" if None not in (old_stack, new_stack) else ""
+        print(f"  {label}: {format_stack(old_stack)} -> {format_stack(new_stack)}{delta}")
+        if change["old_path"] != change["new_path"]:
+            print(f"      old: {' -> '.join(change['old_path'])}")
+            print(f"      new: {' -> '.join(change['new_path'])}")
+    if not comparison["entry_points"]:
+        print("  No changes above the threshold.")
+
+    print("\nFunctions:")
+    for change in comparison["functions"]:
+        old_size, new_size = change["old_size"], change["new_size"]
+        if old_size is None:
+            print(f"  {change['function']}: new ({new_size} bytes)")
+        elif new_size is None:
+            print(f"  {change['function']}: removed (was {old_size} bytes)")
+        else:
+            print(f"  {change['function']}: {old_size} -> {new_size} bytes ({new_size - old_size:+d})")
+    if not comparison["functions"]:
+        print("  No changes above the threshold.")
+
+    print(f"\nCall edges: {comparison['edges_added']} added, {comparison['edges_removed']} removed.")
+    if comparison["regressions"]:
+        print(f"{COLOR_RED}Result: {comparison['regressions']} entry point(s) grew by more than "
+              f"{threshold} bytes.{COLOR_RESET}")
+    else:
+        print("Result: No entry point grew by more than the threshold.")
+    print(f"\n{header}")
+
+
+# --- Frame Ranking ---
+def _add_to_frame_totals(totals, key, stack_size):
+    """Adds a frame to the [frame_count, total_bytes, largest_frame] of 'key'."""
+    entry = totals.get(key)
+    if entry is None:
+        totals[key] = [1, stack_size, stack_size]
+    else:
+        entry[0] += 1
+        entry[1] += stack_size
+        entry[2] = max(entry[2], stack_size)
+
+
+def _push_bounded(heap, item, size):
+    """Keeps the 'size' largest items in a min-heap."""
+    if len(heap) < size:
+        heapq.heappush(heap, item)
+    elif item > heap[0]:
+        heapq.heapreplace(heap, item)
+
+
+def rank_stack_frames(su_dirs, top_count, is_debug_mode, jobs=1, cache=None):
+    """
+    Ranks the stack frames of all functions in the .su files, without a call graph or ELF.
+
+    The frames are streamed through bounded heaps, so only the top frames
+    are kept, and are totaled per .su file, per directory and per qualifier.
+    Frames with a 'dynamic' qualifier are ranked separately as well.
+
+    Returns:
+        dict: The ranking report (see _print_frame_ranking).
+    """
+    filepaths = _walk_input_files(su_dirs, _is_su_file, "--su-dir", is_debug_mode)
+    top_frames, top_dynamic_frames = [], []
+    per_file, per_directory, per_qualifier = {}, {}, {}
+    frame_count = 0
+    results = chain(_parse_files(_parse_su_file, filepaths, jobs, cache, is_debug_mode),
+                    _parse_archives(su_dirs, _is_su_file, _parse_su_data, is_debug_mode))
+    file_count = 0
+    for file_count, (filepath, file_result) in enumerate(results, 1):
+        file_stack_usage, file_qualifiers, malformed_lines, _ = file_result
+        for line in malformed_lines:
+            print(f"  [Warning] Skipping malformed line in '{filepath}': '{line}'")
+        directory = os.path.dirname(filepath)
+        for func_name, stack_size in file_stack_usage.items():
+            qualifier = file_qualifiers[func_name]
+            # Ties keep the frame seen first.
+            frame = (stack_size, -frame_count, func_name, qualifier, filepath)
+            frame_count += 1
+            _push_bounded(top_frames, frame, top_count)
+            if 'dynamic' in qualifier:
+                _push_bounded(top_dynamic_frames, frame, top_count)
+            _add_to_frame_totals(per_file, filepath, stack_size)
+            _add_to_frame_totals(per_directory, directory, stack_size)
+            _add_to_frame_totals(per_qualifier, qualifier, stack_size)
+
+    def frames_to_report(heap):
+        return [{"function": func_name, "size": stack_size, "qualifier": qualifier, "file": filepath}
+                for stack_size, _, func_name, qualifier, filepath in sorted(heap, reverse=True)]
+
+    def totals_to_report(totals, key_name, count=None):
+        keys = sorted(totals, key=lambda key: (-totals[key][2], -totals[key][1], key))
+        return [{key_name: key, "frames": totals[key][0], "total": totals[key][1], "largest": totals[key][2]}
+                for key in keys[:count]]
+
+    g_metrics.count('su_files_walked', file_count)
+    g_metrics.count('frames_ranked', frame_count)
+    return {
+        "files_parsed": file_count,
+        "frame_count": frame_count,
+        "top_frames": frames_to_report(top_frames),
+        "dynamic_frames": frames_to_report(top_dynamic_frames),
+        "dynamic_frame_count": sum(totals[0] for qualifier, totals in per_qualifier.items() if 'dynamic' in qualifier),
+        "per_qualifier": totals_to_report(per_qualifier, "qualifier"),
+        "per_file": totals_to_report(per_file, "file", top_count),
+        "per_directory": totals_to_report(per_directory, "directory", top_count),
+    }
+
+
+def _print_frame_ranking(report, top_count):
+    """Prints the frame ranking report."""
+    def print_frames(frames):
+        name_width = max([len(frame["function"]) for frame in frames] + [len("Function")])
+        print(f"  {'Rank':>4}  {'Size':>8}  {'Qualifier':<16}  {'Function':<{name_width}}  File")
+        for rank, frame in enumerate(frames, 1):
+            print(f"  {rank:>4}  {frame['size']:>8}  {frame['qualifier']:<16}  "
+                  f"{frame['function']:<{name_width}}  {frame['file']}")
+
+    def print_totals(entries, key_name):
+        for entry in entries:
+            print(f"  largest: {entry['largest']:>8}  total: {entry['total']:>10}  frames: {entry['frames']:>6}"
+                  f"  {entry[key_name]}")
+
+    header = "=" * 70
+    print(f"\n{header}")
+    print("--- Stack Frame Ranking ---".center(70))
+    print(f"{header}\n")
+    print(f"Ranked {report['frame_count']} frames from {report['files_parsed']} .su files.")
+    if not report["top_frames"]:
+        print("No stack frames found.")
+        return
+
+    print(f"\nTop {len(report['top_frames'])} stack frames:")
+    print_frames(report["top_frames"])
+    print(f"\nDynamic stack frames ({report['dynamic_frame_count']} in total, top {top_count} shown):")
+    if report["dynamic_frames"]:
+        print_frames(report["dynamic_frames"])
+    else:
+        print("  None.")
+    print("\nPer qualifier:")
+    print_totals(report["per_qualifier"], "qualifier")
+    print(f"\nTop {len(report['per_file'])} .su files by largest frame:")
+    print_totals(report["per_file"], "file")
+    print(f"\nTop {len(report['per_directory'])} directories by largest frame:")
+    print_totals(report["per_directory"], "directory")
+    print(f"\n{header}")
+
+
+# --- Batch Analysis ---
+def load_batch_manifest(filepath):
+    """
+    Loads a JSON manifest of the variants to analyze in one batch.
+
+    The manifest is a list of variants, or an object with a "variants"
+    list. Each variant has a unique "name" and an "elf_file", plus the
+    "su_dirs", "cgraph_dirs", "start_func", "vector_table", "ignore_calls",
+    "add_calls" and "elf_frames" of the matching command line options.
+    Relative paths are resolved against the manifest's directory.
+    """
+    _validate_file_path(filepath)
+    with open(filepath, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    variants = manifest.get("variants") if isinstance(manifest, dict) else manifest
+    if not isinstance(variants, list) or not variants:
+        print(f"{COLOR_RED}[Error] No variants found in batch manifest: {filepath}{COLOR_RESET}")
+        exit(1)
+
+    base_dir = os.path.dirname(os.path.abspath(filepath))
+
+    def resolve(path):
+        return os.path.join(base_dir, path) if path else path
+
+    loaded_variants = []
+    for index, variant in enumerate(variants, 1):
+        name = variant.get("name") or f"variant_{index}"
+        if not variant.get("elf_file") or not (variant.get("su_dirs") or variant.get("cgraph_dirs")):
+            print(f"{COLOR_RED}[Error] Variant '{name}' in '{filepath}' needs an 'elf_file' and "
+                  f"'su_dirs' or 'cgraph_dirs'.{COLOR_RESET}")
+            exit(1)
+        if any(loaded["name"] == name for loaded in loaded_variants):
+            print(f"{COLOR_RED}[Error] Duplicate variant name '{name}' in '{filepath}'.{COLOR_RESET}")
+            exit(1)
+        start_func = variant.get("start_func", "main")
+        if isinstance(start_func, str):
+            start_func = start_func.split(',')
+        su_dirs = [resolve(path) for path in variant.get("su_dirs") or []]
+        cgraph_dirs = [resolve(path) for path in variant.get("cgraph_dirs") or []]
+        elf_frames = bool(variant.get("elf_frames"))
+        loaded_variants.append({
+            "name": name,
+            "elf_file": resolve(variant["elf_file"]),
+            "su_dirs": su_dirs if su_dirs or elf_frames else cgraph_dirs,
+            "cgraph_dirs": cgraph_dirs or su_dirs,
+            "start_func": [func.strip() for func in start_func if func.strip()] or ['main'],
+            "vector_table": variant.get("vector_table"),
+            "ignore_calls": resolve(variant.get("ignore_calls")),
+            "add_calls": [resolve(path) for path in variant.get("add_calls") or []],
+            "elf_frames": elf_frames,
+        })
+    return loaded_variants
+
+
+def _parse_batch_inputs(variants, jobs, su_cache, cgraph_cache, is_debug_mode):
+    """
+    Parses the input files of all variants, each distinct file content only once.
+
+    Every variant gets the content digests of its .su and cgraph files
+    ("su_digests", "cgraph_digests"), and the parse results are stored in
+    g_batch_parse_results by kind and digest. Each input archive is streamed
+    once, however many variants use it and for whichever kinds of input.
+
+    Returns:
+        tuple: (file_count, distinct_file_count)
+    """
+    file_counts, distinct_counts = defaultdict(int), defaultdict(int)
+
+    def store_result(kind, filepath, digest, result):
+        if kind == "su":
+            for line in result[2]:
+                print(f"  [Warning] Skipping malformed line in '{filepath}': '{line}'")
+        g_batch_parse_results[(kind, digest)] = result
+
+    variant_filepaths, digests = {}, {}
+    for kind, is_wanted_file, option_name, parse_func, cache in (
+            ("su", _is_su_file, "--su-dir", _parse_su_file, su_cache),
+            ("cgraph", _is_cgraph_file, "--cgraph-dir", _parse_cgraph_file, cgraph_cache)):
+        variant_filepaths[kind] = [
+            [os.path.abspath(filepath)
+             for filepath in _walk_input_files(variant[f"{kind}_dirs"], is_wanted_file, option_name, is_debug_mode)]
+            for variant in variants
+        ]
+        filepaths = list(dict.fromkeys(chain.from_iterable(variant_filepaths[kind])))
+        digests[kind] = dict(zip(filepaths, _map_files(_file_digest, filepaths, jobs)))
+
+        # Keep the first file of every content and parse only those.
+        first_filepaths = {}
+        for filepath, digest in digests[kind].items():
+            first_filepaths.setdefault(digest, filepath)
+        distinct_filepaths = list(first_filepaths.values())
+        for filepath, result in _parse_files(parse_func, distinct_filepaths, jobs, cache, is_debug_mode):
+            store_result(kind, filepath, digests[kind][filepath], result)
+        file_counts[kind] += len(filepaths)
+        distinct_counts[kind] += len(distinct_filepaths)
+
+    # Stream every archive once, for all the kinds of input the variants use it for.
+    archive_kinds = defaultdict(set)
+    for variant in variants:
+        for kind in ("su", "cgraph"):
+            for path in variant[f"{kind}_dirs"]:
+                if _is_archive(path):
+                    archive_kinds[os.path.abspath(path)].add(kind)
+    archive_digests = defaultdict(list)  # {(kind, archive_path): [digest]}
+    for archive_path, kinds in archive_kinds.items():
+        for kind, member_path, data in _iter_archive_inputs(archive_path, kinds, is_debug_mode):
+            digest = _data_digest(data)
+            archive_digests[(kind, archive_path)].append(digest)
+            file_counts[kind] += 1
+            if (kind, digest) not in g_batch_parse_results:
+                parse_data_func = _parse_su_data if kind == "su" else _parse_cgraph_data
+                store_result(kind, member_path, digest, parse_data_func(data))
+                distinct_counts[kind] += 1
+
+    for kind in ("su", "cgraph"):
+        for variant, filepaths_of_variant in zip(variants, variant_filepaths[kind]):
+            variant[f"{kind}_digests"] = [digests[kind][filepath] for filepath in filepaths_of_variant] + [
+                digest for path in variant[f"{kind}_dirs"] if _is_archive(path)
+                for digest in archive_digests[(kind, os.path.abspath(path))]
+            ]
+        debug_print(f"  DBG: {file_counts[kind]} {kind} file(s), {distinct_counts[kind]} distinct.", is_debug_mode)
+
+    file_count, distinct_file_count = sum(file_counts.values()), sum(distinct_counts.values())
+    g_metrics.count('batch_files', file_count)
+    g_metrics.count('batch_distinct_files', distinct_file_count)
+    return file_count, distinct_file_count
+
+
+def _analyze_batch_variant(variant, top_count, is_debug_mode):
+    """
+    Analyzes one variant from the shared parse results.
+
+    Runs in a worker process, so everything the analysis prints is captured
+    and returned with the report, to be printed in manifest order. A variant
+    without any stack usage gets a report with only its "name", "elf_file"
+    and "error".
+
+    Returns:
+        tuple: (report, printed_output)
+    """
+    output = io.StringIO()
+    with redirect_stdout(output):
+        g_deferred_warnings.clear()
+        stack_usage = {}
+        for digest in variant["su_digests"]:
+            for func_name, stack_size in g_batch_parse_results[("su", digest)][0].items():
+                if func_name not in stack_usage or stack_size > stack_usage[func_name]:
+                    stack_usage[func_name] = stack_size
+        symbol_index = None
+        if variant["elf_frames"] and variant["vector_table"]:
+            symbol_index = load_elf_symbol_index(variant["elf_file"])
+        if variant["elf_frames"]:
+            stack_usage = merge_cfi_frame_sizes(stack_usage, variant["elf_file"], is_debug_mode, symbol_index)
+        if not stack_usage:
+            if variant["elf_frames"]:
+                error = "No frame sizes found in the ELF file or in .su files."
+                print(f"{COLOR_RED}[Error] {error}{COLOR_RESET}")
+            else:
+                error = f"No stack usage (.su) files found in specified directories: {', '.join(variant['su_dirs'])}"
+                print(f"{COLOR_RED}[Error] {error}")
+                print(f"   Please ensure the project is built with the '-fstack-usage' compiler option.{COLOR_RESET}")
+            return {"name": variant["name"], "elf_file": variant["elf_file"], "error": error}, output.getvalue()
+
+        ignore_set = load_annotation_file(variant["ignore_calls"])
+        call_edges = chain.from_iterable(g_batch_parse_results[("cgraph", digest)][0]
+                                         for digest in variant["cgraph_digests"])
+        call_graph = CallGraph.from_edges(call_edge for call_edge in call_edges if call_edge not in ignore_set)
+        call_graph.load_stack_usage(stack_usage)
+        if not variant["cgraph_digests"]:
+            g_deferred_warnings.append(
+                f"{COLOR_BRIGHT_YELLOW}[Warning] No .cgraph or .ipa files found in specified directories: "
+                f"{', '.join(variant['cgraph_dirs'])}\n"
+                f"   To generate them, the project must be built with the '-fdump-ipa-cgraph' compiler option."
+                f"{COLOR_RESET}")
+
+        entry_points = set(variant["start_func"])
+        if variant["vector_table"]:
+            entry_points.update(get_isr_entry_points(variant["elf_file"], variant["vector_table"], is_debug_mode,
+                                                     symbol_index))
+        entry_points = sorted(entry_points)
+        print(f"   Entry points: {entry_points}")
+
+        all_scenarios_add_sets = {f: load_annotation_file(f) for f in variant["add_calls"]}
+        worst_stack, worst_path, scenario_name, scenario_reports = _run_scenario_analysis(
+            entry_points, call_graph, all_scenarios_add_sets, is_debug_mode, top_count
+        )
+        _print_final_results(worst_stack, worst_path, scenario_name, call_graph)
+        _print_deferred_warnings(g_deferred_warnings)
+
+    report = {
+        "name": variant["name"],
+        "elf_file": variant["elf_file"],
+        "entry_points": entry_points,
+        "functions_with_stack_usage": len(stack_usage),
+        "overall": {
+            "scenario": scenario_name,
+            "worst_stack": _stack_to_json(worst_stack),
+            "recursive": worst_stack == float('inf'),
+            "frames": _build_path_frames(worst_path, call_graph),
+        },
+        "scenarios": scenario_reports,
+    }
+    return report, output.getvalue()
+
+
+def _init_batch_worker(parse_results):
+    g_batch_parse_results.update(parse_results)
+
+
+def run_batch_analysis(variants, jobs, top_count, is_debug_mode):
+    """
+    Analyzes all variants, in parallel when jobs > 1, and prints each variant's results in manifest order.
+
+    Returns:
+        list: One report dict per variant.
+    """
+    worker_count = min(jobs, len(variants))
+    if worker_count <= 1:
+        results = [_analyze_batch_variant(variant, top_count, is_debug_mode) for variant in variants]
+    else:
+        # The shared parse results are sent to every worker once, not with every variant.
+        with ProcessPoolExecutor(max_workers=worker_count, initializer=_init_batch_worker,
+                                 initargs=(g_batch_parse_results,)) as executor:
+            futures = [executor.submit(_analyze_batch_variant, variant, top_count, is_debug_mode)
+                       for variant in variants]
+            results = [future.result() for future in futures]
+
+    reports = []
+    for report, output in results:
+        print(f"\n{'#' * 70}")
+        print(f"### Variant: {report['name']}")
+        print(f"{'#' * 70}")
+        print(output, end='')
+        reports.append(report)
+    return reports
+
+
+def _print_batch_summary(reports):
+    """Prints one line per variant with its worst case."""
+    header = "=" * 70
+    print(f"\n\n{header}")
+    print("--- Batch Analysis Summary ---".center(70))
+    print(f"{header}\n")
+    name_width = max(len(report["name"]) for report in reports)
+    for report in reports:
+        if "error" in report:
+            print(f"  {report['name']:<{name_width}}  {'failed':>14}  {report['error']}")
+            continue
+        overall = report["overall"]
+        if overall["recursive"]:
+            worst = "recursive"
+        elif overall["frames"]:
+            worst = f"{overall['worst_stack']} bytes"
+        else:
+            worst = "no call path"
+        entry_point = overall["frames"][0]["function"] if overall["frames"] else "-"
+        print(f"  {report['name']:<{name_width}}  {worst:>14}  from '{entry_point}' in '{overall['scenario']}'")
+    print(f"\n{header}")
+
+
+# --- Library API and Query Server ---
+def _to_call_map(calls):
+    """Converts [(caller, callee)] or ["caller,callee"] pairs to a {caller: [callee]} map."""
+    if isinstance(calls, (str, dict)):
+        raise TypeError(f"Calls must be a list of pairs, not {type(calls).__name__}.")
+    call_map = defaultdict(list)
+    for call in calls or ():
+        caller, callee = call.split(',') if isinstance(call, str) else call
+        if not isinstance(caller, str) or not isinstance(callee, str):
+            raise TypeError(f"A call must be a pair of function names: {call!r}")
+        call_map[caller.strip()].append(callee.strip())
+    return call_map
+
+
+def _query_function(query, key="function"):
+    """Returns the function name of a query field, which must be a string."""
+    func = query[key]
+    if not isinstance(func, str):
+        raise TypeError(f"'{key}' must be a function name, not {type(func).__name__}.")
+    return func
+
+
+def _query_function_list(query, key):
+    """Returns the optional list of function names of a query field."""
+    funcs = query.get(key)
+    if funcs is not None and (not isinstance(funcs, list) or not all(isinstance(func, str) for func in funcs)):
+        raise TypeError(f"'{key}' must be a list of function names.")
+    return funcs
+
+
+class StackAnalyzer:
+    """
+    A reusable stack analyzer that loads .su, cgraph and ELF data once and
+    answers queries on the loaded graph.
+
+    Example:
+        analyzer = StackAnalyzer('fw.elf', su_dirs=['build'], vector_table='g_pfnVectors')
+        analyzer.worst_path('USART1_IRQHandler', add_calls=[('USART1_IRQHandler', 'rx_callback')])
+    """
+
+    def __init__(self, elf_file=None, su_dirs=(), cgraph_dirs=(), entry_points=('main',), vector_table=None,
+                 ignore_set=frozenset(), jobs=1, cache_dir=None, cache_hash=False, elf_frames=False,
+                 is_debug_mode=False):
+        su_dirs = list(su_dirs or ())
+        cgraph_dirs = list(cgraph_dirs or su_dirs)
+        if not su_dirs and not elf_frames:
+            su_dirs = cgraph_dirs
+        su_cache = ParseCache(cache_dir, 'su', cache_hash) if cache_dir else None
+        cgraph_cache = ParseCache(cache_dir, 'cgraph', cache_hash) if cache_dir else None
+
+        parsed_su_archives, parsed_cgraph_archives = parse_input_archives(su_dirs, cgraph_dirs, is_debug_mode)
+        self.stack_usage = parse_su_files(
+            su_dirs, is_debug_mode, jobs, su_cache, parsed_archives=parsed_su_archives
+        ) if su_dirs else {}
+        symbol_index = load_elf_symbol_index(elf_file) if elf_frames and vector_table else None
+        if elf_frames:
+            self.stack_usage = merge_cfi_frame_sizes(self.stack_usage, elf_file, is_debug_mode, symbol_index)
+        self.call_graph, self.unresolved_calls, _ = build_base_call_graph_from_cgraph(
+            cgraph_dirs, ignore_set, is_debug_mode, jobs, cgraph_cache, parsed_cgraph_archives
+        )
+        self.call_graph.load_stack_usage(self.stack_usage)
+
+        isrs = []
+        if elf_file and vector_table:
+            isrs = get_isr_entry_points(elf_file, vector_table, is_debug_mode, symbol_index)
+        self.entry_points = sorted(set(entry_points or ['main']) | set(isrs))
+        self.base_analysis = WorstCaseAnalysis(self.call_graph)
+
+    def analysis(self, add_calls=None, remove_calls=None):
+        """Returns the analysis with the given (caller, callee) calls added and removed."""
+        return self.base_analysis.for_scenario(_to_call_map(add_calls), _to_call_map(remove_calls))
+
+    def worst_path(self, func, add_calls=None, remove_calls=None, top=1):
+        """Returns the worst-case stack and the 'top' worst paths starting at 'func'."""
+        analysis = self.analysis(add_calls, remove_calls)
+        total_stack = analysis.stack_from(func)
+        return {
+            "function": func,
+            "worst_stack": _stack_to_json(total_stack),
+            "recursive": total_stack == float('inf'),
+            "paths": [
+                {"total": _stack_to_json(path_stack), "frames": _build_path_frames(path, self.call_graph)}
+                for path_stack, path in analysis.top_paths(func, max(1, top))
+            ],
+        }
+
+    def callers(self, func):
+        """Returns the direct callers of 'func' in the base call graph."""
+        if func not in self.call_graph:
+            return []
+        names = self.call_graph.names
+        return sorted(names[caller_id] for caller_id in self.call_graph.callers(self.call_graph.ids[func]))
+
+    def callees(self, func):
+        """Returns the direct callees of 'func' in the base call graph."""
+        if func not in self.call_graph:
+            return []
+        names = self.call_graph.names
+        return [names[callee_id] for callee_id in self.call_graph.callees(self.call_graph.ids[func])]
+
+    def what_if(self, add_calls=None, remove_calls=None, entry_points=None):
+        """Compares the worst case of the entry points before and after a change of calls."""
+        analysis = self.analysis(add_calls, remove_calls)
+        results = []
+        for func in entry_points or self.entry_points:
+            before, after = self.base_analysis.stack_from(func), analysis.stack_from(func)
+            delta = after - before if float('inf') not in (before, after) else None
+            results.append({
+                "entry_point": func,
+                "before": _stack_to_json(before),
+                "after": _stack_to_json(after),
+                "delta": delta,
+                "path": analysis.path_from(func) if after != before else None,
+            })
+        return results
+
+    def handle_query(self, query):
+        """
+        Answers one JSON query, e.g. {"op": "worst_path", "function": "main"}.
+
+        Supported ops: worst_path (function, add_calls, remove_calls, top),
+        callers (function), callees (function), what_if (add_calls,
+        remove_calls, entry_points), entry_points and ping.
+
+        A query that fails for any reason is answered with {"ok": false},
+        so one bad query cannot stop a server.
+        """
+        try:
+            op = query.get("op")
+            if op == "worst_path":
+                result = self.worst_path(_query_function(query), query.get("add_calls"), query.get("remove_calls"),
+                                         int(query.get("top", 1)))
+            elif op == "callers":
+                func = _query_function(query)
+                result = {"function": func, "callers": self.callers(func)}
+            elif op == "callees":
+                func = _query_function(query)
+                result = {"function": func, "callees": self.callees(func)}
+            elif op == "what_if":
+                result = {"entry_points": self.what_if(query.get("add_calls"), query.get("remove_calls"),
+                                                       _query_function_list(query, "entry_points"))}
+            elif op == "entry_points":
+                result = {"entry_points": self.entry_points}
+            elif op == "ping":
+                result = {}
+            else:
+                raise ValueError(f"Unknown op: {op!r}")
+            response = {"ok": True, **result}
+        except Exception as e:
+            response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        if isinstance(query, dict) and "id" in query:
+            response["id"] = query["id"]
+        return response
+
+    def handle_line(self, line):
+        """Answers one line of the query protocol, returning the JSON response line."""
+        try:
+            query = json.loads(line)
+            if not isinstance(query, dict):
+                raise ValueError("A query must be a JSON object.")
+        except ValueError as e:
+            return json.dumps({"ok": False, "error": f"Invalid query: {e}"})
+        start = time.perf_counter()
+        response = self.handle_query(query)
+        response["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return json.dumps(response)
+
+
+def serve_stdin(analyzer):
+    """Answers JSON queries read from stdin, one per line, until EOF."""
+    for line in sys.stdin:
+        if line.strip():
+            print(analyzer.handle_line(line), flush=True)
+
+
+def serve_unix_socket(analyzer, socket_path):
+    """Answers JSON queries, one per line, on a local Unix socket until interrupted."""
+    class QueryHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if line.strip():
+                    self.wfile.write(analyzer.handle_line(line).encode() + b"\n")
+                    self.wfile.flush()
+
+    # Replace only a socket left behind by an earlier server, never any other file.
+    try:
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            print(f"{COLOR_RED}[Error] '{socket_path}' exists and is not a socket; not replacing it.{COLOR_RESET}",
+                  file=sys.stderr)
+            exit(1)
+        os.unlink(socket_path)
+    except FileNotFoundError:
+        pass
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    # Queries share the lazily filled analysis results, so they are answered one at a time.
+    with socketserver.UnixStreamServer(socket_path, QueryHandler) as server:
+        print(f"Serving stack analysis queries on: {socket_path}", file=sys.stderr)
+        previous_sigterm_handler = signal.signal(signal.SIGTERM, stop)  # Clean up on SIGTERM as on Ctrl+C.
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            signal.signal(signal.SIGTERM, previous_sigterm_handler)
+            os.unlink(socket_path)
+
+
+# --- Watch Mode ---
+def _input_file_identities(dirs, is_wanted_file):
+    """Returns {filepath: (mtime_ns, size)} for the wanted files under 'dirs'."""
+    identities = {}
+    for input_dir in dirs:
+        for dirpath, _, filenames in os.walk(input_dir):
+            for filename in filenames:
+                if is_wanted_file(filename):
+                    filepath = os.path.join(dirpath, filename)
+                    try:
+                        st = os.stat(filepath)
+                    except FileNotFoundError:
+                        continue  # Deleted while walking; the next scan will tell.
+                    identities[filepath] = (st.st_mtime_ns, st.st_size)
+    return identities
+
+
+def _changed_filepaths(known_files, identities):
+    """Returns the files that were added, modified or deleted since 'known_files' was recorded."""
+    changed = [filepath for filepath, identity in identities.items()
+               if filepath not in known_files or known_files[filepath][0] != identity]
+    changed.extend(filepath for filepath in known_files if filepath not in identities)
+    return changed
+
+
+class IncrementalInputs:
+    """
+    The .su and cgraph inputs kept per file, so that an update only re-parses
+    the files that changed since the previous one.
+
+    Stack sizes are merged from the per-file results (the largest wins) and
+    call edges are counted per file that contains them, so every update
+    reports exactly which functions got a new stack size or new callees.
+    """
+
+    def __init__(self, su_dirs, cgraph_dirs, ignore_set, jobs=1):
+        self.su_dirs = su_dirs
+        self.cgraph_dirs = cgraph_dirs
+        self.ignore_set = ignore_set
+        self.jobs = jobs
+        self.su_files = {}  # {filepath: (identity, {function_name: stack_size})}
+        self.cgraph_files = {}  # {filepath: (identity, [(caller, callee)])}
+        self.stack_usage = {}
+        self.defining_files = defaultdict(set)  # {function_name: {.su filepath}}
+        self.edge_counts = {}  # {(caller, callee): number of cgraph files with the call}
+
+    def scan(self):
+        """Returns the current (su_identities, cgraph_identities) of the input files."""
+        return (_input_file_identities(self.su_dirs, _is_su_file),
+                _input_file_identities(self.cgraph_dirs, _is_cgraph_file))
+
+    def update(self, identities):
+        """
+        Re-parses the files whose identity changed and merges their results.
+
+        Args:
+            identities (tuple): The (su_identities, cgraph_identities) returned by scan().
+
+        Returns:
+            tuple: (changed_filepaths, {function_name}) - the functions whose
+                   stack size or callees changed.
+        """
+        su_identities, cgraph_identities = identities
+        changed_su = _changed_filepaths(self.su_files, su_identities)
+        changed_cgraph = _changed_filepaths(self.cgraph_files, cgraph_identities)
+
+        # Parse everything first so that a file vanishing mid-build leaves the state untouched.
+        su_parsed = [filepath for filepath in changed_su if filepath in su_identities]
+        su_results = dict(zip(su_parsed, _map_files(_parse_su_file, su_parsed, self.jobs)))
+        cgraph_parsed = [filepath for filepath in changed_cgraph if filepath in cgraph_identities]
+        cgraph_results = dict(zip(cgraph_parsed, _map_files(_parse_cgraph_file, cgraph_parsed, self.jobs)))
+
+        changed_functions = self._update_stack_usage(changed_su, su_identities, su_results)
+        changed_functions.update(self._update_call_edges(changed_cgraph, cgraph_identities, cgraph_results))
+        return changed_su + changed_cgraph, changed_functions
+
+    def _update_stack_usage(self, changed_filepaths, identities, results):
+        touched_functions = set()
+        for filepath in changed_filepaths:
+            _, old_stack_usage = self.su_files.pop(filepath, (None, {}))
+            for func_name in old_stack_usage:
+                self.defining_files[func_name].discard(filepath)
+            touched_functions.update(old_stack_usage)
+            if filepath in results:
+                file_stack_usage, _, malformed_lines, _ = results[filepath]
+                for line in malformed_lines:
+                    print(f"  [Warning] Skipping malformed line in '{filepath}': '{line}'")
+                self.su_files[filepath] = (identities[filepath], file_stack_usage)
+                for func_name in file_stack_usage:
+                    self.defining_files[func_name].add(filepath)
+                touched_functions.update(file_stack_usage)
+
+        resized_functions = set()
+        for func_name in touched_functions:
+            filepaths = self.defining_files[func_name]
+            stack_size = max(self.su_files[filepath][1][func_name] for filepath in filepaths) if filepaths else None
+            if stack_size != self.stack_usage.get(func_name):
+                resized_functions.add(func_name)
+                if stack_size is None:
+                    del self.stack_usage[func_name]
+                else:
+                    self.stack_usage[func_name] = stack_size
+            if not filepaths:
+                del self.defining_files[func_name]
+        return resized_functions
+
+    def _update_call_edges(self, changed_filepaths, identities, results):
+        changed_edges = set()
+        for filepath in changed_filepaths:
+            _, old_edges = self.cgraph_files.pop(filepath, (None, []))
+            for call_edge in old_edges:
+                self.edge_counts[call_edge] -= 1
+                if not self.edge_counts[call_edge]:
+                    del self.edge_counts[call_edge]
+                    changed_edges ^= {call_edge}
+            if filepath in results:
+                call_edges, _, _ = results[filepath]
+                call_edges = [call_edge for call_edge in call_edges if call_edge not in self.ignore_set]
+                self.cgraph_files[filepath] = (identities[filepath], call_edges)
+                for call_edge in call_edges:
+                    self.edge_counts[call_edge] = self.edge_counts.get(call_edge, 0) + 1
+                    if self.edge_counts[call_edge] == 1:
+                        changed_edges ^= {call_edge}
+        # An edge removed by one file and added back by another cancels out above.
+        return {caller for caller, _ in changed_edges}
+
+    def call_graph(self):
+        """Builds a CallGraph of the current call edges and stack sizes (no file is re-read)."""
+        call_graph = CallGraph.from_edges(self.edge_counts)
+        call_graph.load_stack_usage(self.stack_usage)
+        return call_graph
+
+
+def _find_affected_entry_points(call_graph, changed_functions, entry_points, all_scenarios_add_sets=None):
+    """
+    Returns the entry points that can reach any of 'changed_functions'.
+
+    The callers are walked in the current graph plus the calls added by the
+    --add-calls scenarios, since a scenario result can change through a
+    function that only a scenario calls. An entry point that could reach a
+    changed function only through a removed call still reaches the caller
+    that lost the call, which is itself a changed function.
+    """
+    added_callers_of = defaultdict(set)
+    for add_set in (all_scenarios_add_sets or {}).values():
+        for caller, callee in add_set:
+            added_callers_of[callee].add(caller)
+
+    names = call_graph.names
+    pending = list(changed_functions)
+    reached = set(pending)
+    while pending:
+        func = pending.pop()
+        callers = added_callers_of.get(func, ())
+        func_id = call_graph.ids.get(func)
+        if func_id is not None:
+            callers = chain(callers, (names[caller_id] for caller_id in call_graph.callers(func_id)))
+        for caller in callers:
+            if caller not in reached:
+                reached.add(caller)
+                pending.append(caller)
+    return [func for func in entry_points if func in reached]
+
+
+def _analyze_entry_points(call_graph, entry_points, all_scenarios_add_sets):
+    """Returns {entry_point: (worst_stack, path, scenario_name)}, the worst over all scenarios."""
+    base_analysis = WorstCaseAnalysis(call_graph)
+    scenarios = [('Base', base_analysis)]
+    scenarios.extend((os.path.basename(scenario_file), base_analysis.for_scenario(_to_call_map(add_set)))
+                     for scenario_file, add_set in all_scenarios_add_sets.items())
+
+    results = {}
+    for func in entry_points:
+        for scenario_name, analysis in scenarios:
+            total_stack = analysis.stack_from(func)
+            if func not in results or total_stack > results[func][0]:
+                results[func] = (total_stack, analysis.path_from(func), scenario_name)
+    return results
+
+
+def _format_stack(total_stack):
+    return "recursive" if total_stack == float('inf') else f"{int(total_stack)} bytes"
+
+
+def _print_watch_delta(previous_results, results):
+    """Prints the entry points whose worst case changed between two updates."""
+    changed_count = 0
+    for func in sorted(set(previous_results) | set(results)):
+        if func not in results:
+            print(f"   {func}: no longer an entry point")
+        elif func not in previous_results:
+            print(f"   {func}: {_format_stack(results[func][0])} (new entry point)")
+        elif results[func][:2] != previous_results[func][:2]:
+            old_stack, new_stack = previous_results[func][0], results[func][0]
+            delta = ""
+            if float('inf') not in (old_stack, new_stack):
+                delta = f" ({int(new_stack - old_stack):+d})"
+            print(f"   {func}: {_format_stack(old_stack)} -> {_format_stack(new_stack)}{delta}"
+                  f" [{results[func][2]}]")
+            print(f"      {' -> '.join(results[func][1])}")
+        else:
+            continue
+        changed_count += 1
+    if not changed_count:
+        print("   No change in worst-case stack usage.")
+
+
+def _print_watch_worst(results):
+    if results:
+        func = max(results, key=lambda name: results[name][0])
+        total_stack, path, scenario_name = results[func]
+        print(f"   Worst case: {_format_stack(total_stack)} from '{func}' [{scenario_name}]: {' -> '.join(path)}")
+
+
+def watch_inputs(inputs, start_functions, elf_file, vector_table, all_scenarios_add_sets, interval, is_debug_mode):
+    """
+    Re-analyzes the inputs every time the build changes them, until interrupted.
+
+    The input trees are polled every 'interval' seconds. Once a change is seen,
+    the trees are polled until they stop changing, so a build in progress is
+    analyzed only once it has finished. Only the changed files are re-parsed,
+    and only the entry points that can reach a changed function are
+    re-analyzed; the others keep their previous result.
+    """
+    def load_entry_points():
+        isrs = get_isr_entry_points(elf_file, vector_table, is_debug_mode) if vector_table else []
+        return sorted(set(start_functions) | set(isrs))
+
+    def elf_identity():
+        try:
+            st = os.stat(elf_file)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    for dirs, option_name in ((inputs.su_dirs, "--su-dir"), (inputs.cgraph_dirs, "--cgraph-dir")):
+        for input_dir in dirs:
+            if not os.path.isdir(input_dir):
+                print(f"{COLOR_BRIGHT_YELLOW}[Warning] Directory for {option_name} not found, "
+                      f"watching for it: {input_dir}{COLOR_RESET}")
+
+    identities, last_elf_identity = inputs.scan(), elf_identity()
+    inputs.update(identities)
+    if not inputs.stack_usage:
+        print(f"{COLOR_RED}[Error] No stack usage (.su) files found in specified directories: "
+              f"{', '.join(inputs.su_dirs)}")
+        print(f"   Please ensure the project is built with the '-fstack-usage' compiler option.{COLOR_RESET}")
+        exit(1)
+    if not identities[1]:
+        print(f"{COLOR_BRIGHT_YELLOW}[Warning] No .cgraph or .ipa files found in specified directories: "
+              f"{', '.join(inputs.cgraph_dirs)}\n"
+              f"   To generate them, the project must be built with the '-fdump-ipa-cgraph' compiler option.{COLOR_RESET}")
+    call_graph = inputs.call_graph()
+    entry_points = load_entry_points()
+    results = _analyze_entry_points(call_graph, entry_points, all_scenarios_add_sets)
+    print(f"Watching {len(identities[0])} .su and {len(identities[1])} cgraph file(s) "
+          f"for {len(entry_points)} entry point(s). Press Ctrl+C to stop.")
+    for func in entry_points:
+        print(f"   {func}: {_format_stack(results[func][0])} [{results[func][2]}]")
+    _print_watch_worst(results)
+
+    try:
+        while True:
+            time.sleep(interval)
+            new_identities = inputs.scan()
+            if new_identities == identities and elf_identity() == last_elf_identity:
+                continue
+            while True:
+                time.sleep(interval)
+                settled_identities = inputs.scan()
+                if settled_identities == new_identities:
+                    break
+                new_identities = settled_identities
+
+            start_time = time.perf_counter()
+            try:
+                changed_filepaths, changed_functions = inputs.update(new_identities)
+            except OSError as e:
+                print(f"{COLOR_BRIGHT_YELLOW}[Warning] Could not read the changed inputs, retrying: {e}{COLOR_RESET}")
+                continue
+            identities = new_identities
+            call_graph = inputs.call_graph()
+
+            affected_entry_points = _find_affected_entry_points(call_graph, changed_functions, entry_points,
+                                                                all_scenarios_add_sets)
+            if elf_identity() != last_elf_identity:
+                last_elf_identity = elf_identity()
+                new_entry_points = load_entry_points()
+                affected_entry_points.extend(set(new_entry_points) - set(entry_points))
+                entry_points = new_entry_points
+            previous_results = results
+            results = {func: previous_results[func] for func in entry_points if func in previous_results}
+            results.update(_analyze_entry_points(call_graph, affected_entry_points, all_scenarios_add_sets))
+
+            print(f"\n[{time.strftime('%H:%M:%S')}] {len(changed_filepaths)} file(s) changed, "
+                  f"{len(changed_functions)} function(s) updated, {len(affected_entry_points)}/{len(entry_points)} "
+                  f"entry point(s) re-analyzed in {time.perf_counter() - start_time:.3f}s")
+            for filepath in changed_filepaths:
+                debug_print(f"  DBG: Changed: {filepath}", is_debug_mode)
+            _print_watch_delta(previous_results, results)
+            _print_watch_worst(results)
+    except KeyboardInterrupt:
+        print("\nStopped watching.")
+
+
 def main():
     """Main execution function."""
     parser = argparse.ArgumentParser(
         description="Advanced static stack analyzer using GCC cgraph files.",
         formatter_class=argparse.RawTextHelpFormatter
     )
-    parser.add_argument('--elf-file', required=True, help="Path to the output ELF file.")
-    parser.add_argument('--su-dir', nargs='+', help="One or more directories containing .su files.")
-    parser.add_argument('--cgraph-dir', nargs='+', help="One or more directories containing .cgraph files.")
+    parser.add_argument('--elf-file', help="Path to the output ELF file (required unless --rank-frames).")
+    parser.add_argument('--su-dir', nargs='+',
+                        help="One or more directories or archives (.tar, .tar.gz, .tar.xz, .tar.zst, .zip)\n"
+                             "containing .su files.")
+    parser.add_argument('--cgraph-dir', nargs='+',
+                        help="One or more directories or archives containing .cgraph files.")
     parser.add_argument('--start-func', default='main', help="Comma-separated list of entry points (e.g., main,task1).")
     parser.add_argument('--vector-table', help="Symbol name of the vector table (e.g., g_pfnVectors).")
     parser.add_argument('--ignore-calls', help="File with 'caller,callee' pairs to ignore.")
     parser.add_argument('--add-calls', nargs='+', help="One or more annotation files for callback scenarios.")
+    parser.add_argument('--elf-frames', action='store_true',
+                        help="Derive frame sizes from the ELF's .debug_frame/.eh_frame call frame information.\n"
+                             "With --su-dir, the .su sizes are cross-checked and kept where both exist;\n"
+                             "without it, no .su files are read.")
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help="Number of worker processes for parsing .su/.cgraph files and for analyzing\n"
+                             "scenarios (0: all CPUs, default: 1).")
+    parser.add_argument('--cache-dir', help="Directory for a persistent cache of parsed .su/.cgraph files.")
+    parser.add_argument('--cache-hash', action='store_true',
+                        help="Validate cached files by content hash instead of mtime (use with --cache-dir).")
+    parser.add_argument('--top', type=int, default=0,
+                        help="Report the N worst distinct call paths of every entry point in every scenario.")
+    parser.add_argument('--json-output', help="Write the analysis results (paths with per-frame sizes) to a JSON file.")
+    parser.add_argument('--save-snapshot', metavar='FILE',
+                        help="Save the resolved call graph, frame sizes and worst-case results\n"
+                             "to a compact binary snapshot, e.g. of a baseline build.")
+    parser.add_argument('--compare-to', metavar='FILE',
+                        help="Compare the results with a snapshot saved by --save-snapshot. Exits with 1\n"
+                             "if an entry point's worst case grew by more than --compare-threshold.")
+    parser.add_argument('--compare-threshold', type=int, default=0, metavar='BYTES',
+                        help="Only report stack changes larger than this many bytes (default: 0).")
+    parser.add_argument('--batch', metavar='MANIFEST',
+                        help="Analyze all variants listed in a JSON manifest, each with its own ELF file,\n"
+                             "directories, entry points and scenarios. Files with identical content are\n"
+                             "parsed once, and the variants are analyzed in parallel with --jobs.")
+    parser.add_argument('--rank-frames', type=int, nargs='?', const=20, metavar='N',
+                        help="Only rank the stack frames in the .su files: the N largest frames (default: 20),\n"
+                             "dynamic frames, and totals per qualifier, .su file and directory.\n"
+                             "No call graph is built and the ELF file is not needed.")
+    parser.add_argument('--serve', nargs='?', const='-', metavar='SOCKET',
+                        help="Load the graph once and answer JSON queries, one per line,\n"
+                             "on stdin/stdout ('-', the default) or on a Unix socket path.")
+    parser.add_argument('--watch', action='store_true',
+                        help="Keep running and re-analyze whenever the .su/.cgraph files change,\n"
+                             "re-parsing only the changed files and printing the change in results.")
+    parser.add_argument('--watch-interval', type=float, default=1.0,
+                        help="Seconds between polls of the input directories in --watch mode (default: 1.0).")
+    parser.add_argument('--profile', action='store_true',
+                        help="Print wall time, memory and counters per phase. Memory is the process peak RSS\n"
+                             "so far (cumulative), how much the phase raised it, and the phase's own\n"
+                             "Python heap peak (traced with tracemalloc).")
+    parser.add_argument('--metrics-json',
+                        help="Write per-phase timings, memory and counters to a JSON file. The RSS figures\n"
+                             "are the cumulative process peak and its increase during each phase.")
     parser.add_argument('--debug', action='store_true', help="Enable detailed debug printing.")
     args = parser.parse_args()
 
     debug_print("DEBUG MODE ENABLED", args.debug)
+    if args.profile:
+        g_metrics.trace_memory = True
+        tracemalloc.start()
 
-    if not args.su_dir and not args.cgraph_dir:
+    if not args.su_dir and not args.cgraph_dir and not args.batch:
         parser.error("At least one of --su-dir or --cgraph-dir must be specified.")
-
-    su_dirs = args.su_dir if args.su_dir else args.cgraph_dir
+    if args.rank_frames is not None and args.rank_frames <= 0:
+        parser.error("--rank-frames must be a positive number.")
+    if not args.elf_file and args.rank_frames is None and not args.batch:
+        parser.error("--elf-file is required unless --rank-frames or --batch is used.")
+    if args.jobs < 0:
+        parser.error("--jobs must be 0 or a positive number.")
+    if args.top < 0:
+        parser.error("--top must be a positive number.")
+    if args.compare_threshold < 0:
+        parser.error("--compare-threshold must be 0 or a positive number.")
+    if args.watch_interval <= 0:
+        parser.error("--watch-interval must be a positive number.")
+    if args.watch and args.elf_frames:
+        parser.error("--elf-frames cannot be combined with --watch.")
+    if args.watch and any(_is_archive(path) for path in (args.su_dir or []) + (args.cgraph_dir or [])):
+        parser.error("--watch needs input directories to poll; archives are not supported.")
+    jobs = args.jobs or os.cpu_count() or 1
+    su_cache = ParseCache(args.cache_dir, 'su', args.cache_hash) if args.cache_dir else None
+    cgraph_cache = ParseCache(args.cache_dir, 'cgraph', args.cache_hash) if args.cache_dir else None
+
+    if args.batch:
+        variants = load_batch_manifest(args.batch)
+        print(f"1. Parsing the inputs of {len(variants)} variant(s)...")
+        with g_metrics.phase("1. Parse batch inputs"):
+            file_count, distinct_file_count = _parse_batch_inputs(variants, jobs, su_cache, cgraph_cache, args.debug)
+        print(f"   Parsed {distinct_file_count} distinct of {file_count} input files.")
+        print("\n2. Analyzing variants...")
+        with g_metrics.phase("2. Analyze variants"):
+            reports = run_batch_analysis(variants, jobs, args.top, args.debug)
+        _print_batch_summary(reports)
+        if args.json_output:
+            with open(args.json_output, 'w') as f:
+                json.dump({"files": file_count, "distinct_files": distinct_file_count, "variants": reports}, f,
+                          indent=2)
+        if args.profile:
+            g_metrics.print_summary()
+        if args.metrics_json:
+            g_metrics.write_json(args.metrics_json)
+        if any("error" in report for report in reports):
+            exit(1)
+        return
+
+    # With --elf-frames and no --su-dir, the frame sizes come from the ELF file only.
+    su_dirs = (args.su_dir if args.su_dir or args.elf_frames else args.cgraph_dir) or []
     cgraph_dirs = args.cgraph_dir if args.cgraph_dir else args.su_dir
 
-    if not args.su_dir:
+    if not args.su_dir and not args.elf_frames:
         debug_print(f"  DBG: --su-dir not specified, defaulting to cgraph-dir: {su_dirs}", args.debug)
     if not args.cgraph_dir:
         debug_print(f"  DBG: --cgraph-dir not specified, defaulting to su-dir: {cgraph_dirs}", args.debug)
 
+    if args.rank_frames is not None:
+        with g_metrics.phase("Rank frames"):
+            # Ranking only reads .su files, so --elf-frames does not stop it defaulting to --cgraph-dir.
+            report = rank_stack_frames(args.su_dir or args.cgraph_dir, args.rank_frames, args.debug, jobs, su_cache)
+            _print_frame_ranking(report, args.rank_frames)
+        if args.json_output:
+            with open(args.json_output, 'w') as f:
+                json.dump(report, f, indent=2)
+        if args.profile:
+            g_metrics.print_summary()
+        if args.metrics_json:
+            g_metrics.write_json(args.metrics_json)
+        return
+
+    if args.serve:
+        # Keep stdout for the query protocol.
+        with redirect_stdout(sys.stderr):
+            analyzer = StackAnalyzer(
+                args.elf_file, su_dirs, cgraph_dirs, [name.strip() for name in args.start_func.split(',') if name.strip()],
+                args.vector_table, load_annotation_file(args.ignore_calls), jobs, args.cache_dir, args.cache_hash,
+                args.elf_frames, args.debug
+            )
+            _print_deferred_warnings(g_deferred_warnings)
+        if args.serve == '-':
+            serve_stdin(analyzer)
+        else:
+            serve_unix_socket(analyzer, args.serve)
+        return
+
+    if args.watch:
+        start_functions = [name.strip() for name in args.start_func.split(',') if name.strip()] or ['main']
+        inputs = IncrementalInputs(su_dirs, cgraph_dirs, load_annotation_file(args.ignore_calls), jobs)
+        all_scenarios_add_sets = {f: load_annotation_file(f) for f in args.add_calls} if args.add_calls else {}
+        watch_inputs(inputs, start_functions, args.elf_file, args.vector_table, all_scenarios_add_sets,
+                     args.watch_interval, args.debug)
+        return
+
     # 1. Parse Stack Usage (.su) files
     print("1. Parsing .su files...")
-    stack_usage = parse_su_files(su_dirs, args.debug)
+    with g_metrics.phase("1. Parse .su files"):
+        parsed_su_archives, parsed_cgraph_archives = parse_input_archives(su_dirs, cgraph_dirs, args.debug)
+        stack_usage = parse_su_files(
+            su_dirs, args.debug, jobs, su_cache, parsed_archives=parsed_su_archives
+        ) if su_dirs else {}
+        # Read the ELF symbol table once when both the CFI and the vector table need it.
+        symbol_index = load_elf_symbol_index(args.elf_file) if args.elf_frames and args.vector_table else None
+        if args.elf_frames:
+            stack_usage = merge_cfi_frame_sizes(stack_usage, args.elf_file, args.debug, symbol_index)
 
     if not stack_usage:
         dirs_str = ', '.join(su_dirs)
+        if args.elf_frames:
+            print(f"{COLOR_RED}[Error] No frame sizes found in the ELF file or in .su files.{COLOR_RESET}")
+            exit(1)
         print(f"{COLOR_RED}[Error] No stack usage (.su) files found in specified directories: {dirs_str}")
         print(f"   Please ensure the project is built with the '-fstack-usage' compiler option.{COLOR_RESET}")
         exit(1)
@@ -440,30 +3003,35 @@ def main():
 
     # 2. Build Call Graph (.cgraph) files
     print("\n2. Building base call graph...")
-    ignore_set = load_annotation_file(args.ignore_calls)
-    base_call_graph, _, _ = build_base_call_graph_from_cgraph(cgraph_dirs, ignore_set, args.debug)
-    
-    if base_call_graph is None:
-        print("Fatal: Failed to build base call graph. Exiting.")
-        exit(1)
-    print(f"   Base call graph built with {len(base_call_graph)} calling functions.")
+    with g_metrics.phase("2. Build call graph"):
+        ignore_set = load_annotation_file(args.ignore_calls)
+        base_call_graph, _, _ = build_base_call_graph_from_cgraph(
+            cgraph_dirs, ignore_set, args.debug, jobs, cgraph_cache, parsed_cgraph_archives
+        )
+
+        if base_call_graph is None:
+            print("Fatal: Failed to build base call graph. Exiting.")
+            exit(1)
+        base_call_graph.load_stack_usage(stack_usage)
+    print(f"   Base call graph built with {base_call_graph.caller_count()} calling functions.")
 
     # 3. Determine Entry Points
     print("\n3. Determining analysis entry points...")
-    entry_points = set(filter(None, [name.strip() for name in args.start_func.split(',')]))
-    if not entry_points:
-        entry_points = {'main'}
-        print("   --start-func was empty. Defaulting to: ['main']")
-    else:
-        print(f"   Specified entry points: {sorted(list(entry_points))}")
+    with g_metrics.phase("3. Determine entry points"):
+        entry_points = set(filter(None, [name.strip() for name in args.start_func.split(',')]))
+        if not entry_points:
+            entry_points = {'main'}
+            print("   --start-func was empty. Defaulting to: ['main']")
+        else:
+            print(f"   Specified entry points: {sorted(list(entry_points))}")
 
-    if args.vector_table:
-        isrs = get_isr_entry_points(args.elf_file, args.vector_table, args.debug)
-        if isrs:
-            newly_added = set(isrs) - entry_points
-            if newly_added:
-                print(f"   Adding {len(newly_added)} new ISR(s) from vector table: {sorted(list(newly_added))}")
-                entry_points.update(newly_added)
+        if args.vector_table:
+            isrs = get_isr_entry_points(args.elf_file, args.vector_table, args.debug, symbol_index)
+            if isrs:
+                newly_added = set(isrs) - entry_points
+                if newly_added:
+                    print(f"   Adding {len(newly_added)} new ISR(s) from vector table: {sorted(list(newly_added))}")
+                    entry_points.update(newly_added)
 
     final_entry_points = sorted(list(entry_points))
     if not final_entry_points:
@@ -472,18 +3040,43 @@ def main():
     print(f"   Final entry points for analysis: {final_entry_points}")
 
     # 4. Run Analyses
-    all_scenarios_add_sets = {f: load_annotation_file(f) for f in args.add_calls} if args.add_calls else {}
-    
-    if args.debug:
-        _run_uncalled_functions_analysis(stack_usage, base_call_graph, all_scenarios_add_sets, final_entry_points)
-    
-    worst_stack, worst_path, scenario_name = _run_scenario_analysis(
-        final_entry_points, base_call_graph, stack_usage, all_scenarios_add_sets, args.debug
-    )
+    with g_metrics.phase("4. Run analyses"):
+        all_scenarios_add_sets = {f: load_annotation_file(f) for f in args.add_calls} if args.add_calls else {}
+
+        if args.debug:
+            _run_uncalled_functions_analysis(stack_usage, base_call_graph, all_scenarios_add_sets, final_entry_points)
+
+        worst_stack, worst_path, scenario_name, scenario_reports = _run_scenario_analysis(
+            final_entry_points, base_call_graph, all_scenarios_add_sets, args.debug, args.top, jobs
+        )
 
     # 5. Print Final Results and Deferred Warnings
-    _print_final_results(worst_stack, worst_path, scenario_name, stack_usage)
-    _print_deferred_warnings(g_deferred_warnings)
+    with g_metrics.phase("5. Print results"):
+        _print_final_results(worst_stack, worst_path, scenario_name, base_call_graph)
+        _print_deferred_warnings(g_deferred_warnings)
+        if args.json_output:
+            _write_json_report(
+                args.json_output, worst_stack, worst_path, scenario_name, scenario_reports, base_call_graph
+            )
+        if args.save_snapshot:
+            save_snapshot(args.save_snapshot, base_call_graph, stack_usage, scenario_reports)
+            print(f"Snapshot saved to: {args.save_snapshot}")
+
+    # 6. Compare to a Baseline Snapshot
+    comparison = None
+    if args.compare_to:
+        with g_metrics.phase("6. Compare to snapshot"):
+            snapshot = load_snapshot(args.compare_to)
+            comparison = compare_to_snapshot(snapshot, base_call_graph, stack_usage, scenario_reports,
+                                             args.compare_threshold)
+            _print_snapshot_comparison(comparison, args.compare_to, args.compare_threshold)
+
+    if args.profile:
+        g_metrics.print_summary()
+    if args.metrics_json:
+        g_metrics.write_json(args.metrics_json)
+    if comparison and comparison["regressions"]:
+        exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,478 @@
+"""
+stack_analyzer_bench.py
+
+A synthetic-workload benchmark suite for stack_analyzer.py.
+
+Real firmware builds cannot be shared, so this script generates build trees
+that look like the output of a GCC build with '-fstack-usage' and
+'-fdump-ipa-cgraph', and times every phase of the analyzer pipeline on them.
+
+Key Features:
+- Generates .su and .cgraph files, a minimal ARM ELF with a vector table and
+  --add-calls scenario files, from 1k up to 1M functions.
+- The generated call graphs have '.constprop'/'.isra'/'.part' suffixed names,
+  cross-TU calls, deep call chains, wide fan-out and recursive cycles.
+- Times each phase separately: SU parse, cgraph parse, ISR extraction,
+  base and per-scenario analysis, and reporting.
+- Writes a JSON report and compares it against a previous one (--compare),
+  exiting with an error when a phase regressed beyond --threshold.
+
+Example:
+    python3 stack_analyzer_bench.py --sizes 1k,10k,100k --output bench.json
+    python3 stack_analyzer_bench.py --sizes 1k,10k,100k --compare bench.json
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import struct
+import shutil
+import argparse
+import platform
+import tempfile
+from contextlib import redirect_stdout
+
+import stack_analyzer
+
+# --- Constants ---
+FUNCTIONS_PER_TU = 200
+VECTOR_TABLE_NAME = "g_pfnVectors"
+FLASH_BASE_ADDR = 0x08000000
+TEXT_BASE_ADDR = 0x08001000
+FUNCTION_ALIGN_BYTES = 4
+INITIAL_SP_VALUE = 0x20020000
+# ELF constants of the minimal ARM ELF written by _write_elf().
+ELF32_HEADER_SIZE = 52
+ELF32_SECTION_HEADER_SIZE = 40
+ELF32_SYMBOL_SIZE = 16
+EM_ARM = 40
+SHT_PROGBITS, SHT_SYMTAB, SHT_STRTAB, SHT_NOBITS = 1, 2, 3, 8
+SHF_ALLOC, SHF_EXECINSTR = 0x2, 0x4
+STB_GLOBAL = 1
+STT_OBJECT, STT_FUNC = 1, 2
+# GCC clones whose names the analyzer normalizes back to the original function.
+CLONE_SUFFIXES = (".constprop.0", ".isra.0", ".part.0")
+SIZE_SUFFIXES = {'k': 1000, 'm': 1000000}
+# Slowdowns smaller than this are treated as timer noise.
+REGRESSION_MIN_DELTA_SECONDS = 0.01
+PHASES = ("su_parse", "cgraph_parse", "isr_extraction", "base_analysis", "scenario_analysis", "reporting")
+COLOR_RED = "\033[91m"
+COLOR_GREEN = "\033[92m"
+COLOR_RESET = "\033[0m"
+
+
+# --- Helper Functions ---
+def parse_size(text):
+    """Parses a function count such as '1000', '10k' or '1m'."""
+    text = text.strip().lower()
+    if text and text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+
+def format_size(count):
+    """Formats a function count the way it is written on the command line."""
+    for suffix, factor in sorted(SIZE_SUFFIXES.items(), key=lambda item: -item[1]):
+        if count >= factor and count % factor == 0:
+            return f"{count // factor}{suffix}"
+    return str(count)
+
+
+# --- Synthetic Workload Generator ---
+class SyntheticProject:
+    """
+    The shape of a synthetic firmware build.
+
+    Functions are numbered so that most calls go from lower to higher
+    indexes, which keeps the graph mostly acyclic like real code, with a
+    few deliberately recursive cycles on top.
+    """
+
+    def __init__(self, function_count, scenario_count, isr_count, seed):
+        rng = random.Random(seed)
+        self.function_count = function_count
+        self.isr_count = min(isr_count, max(1, function_count // 10))
+        self.names = ["main"] + [f"isr_{i}" for i in range(self.isr_count)]
+        self.names += [f"fn_{i}" for i in range(len(self.names), function_count)]
+        # The symbol names GCC emits, some of them as clones.
+        self.emitted_names = [
+            name + rng.choice(CLONE_SUFFIXES) if name.startswith("fn_") and rng.random() < 0.1 else name
+            for name in self.names
+        ]
+        self.stack_sizes = [rng.choice((0, 8, 16, 24, 32, 48, 64, 96, 128, 256, 512)) for _ in self.names]
+        self.callees = [[] for _ in self.names]
+        self.callbacks = []
+        self._build_calls(rng)
+        self.scenarios = self._build_scenarios(rng, scenario_count)
+
+    def _build_calls(self, rng):
+        count = self.function_count
+        first_body = 1 + self.isr_count
+        for caller in range(count):
+            if caller < first_body:
+                # Entry points call into the body of the program.
+                fanout = 8 if caller == 0 else rng.randint(1, 4)
+            elif rng.random() < 0.01:
+                fanout = rng.randint(20, 60)  # Wide fan-out dispatchers.
+            else:
+                fanout = rng.choice((0, 0, 1, 1, 2, 2, 3, 4))
+            low = max(caller + 1, first_body)
+            if low >= count:
+                continue
+            for _ in range(fanout):
+                # Mostly local calls, sometimes far away (cross-TU).
+                span = FUNCTIONS_PER_TU if rng.random() < 0.8 else count
+                self.callees[caller].append(rng.randrange(low, min(count, low + span)))
+
+        # Deep call chains.
+        for _ in range(max(1, count // 5000)):
+            start = rng.randrange(first_body, count)
+            for depth in range(min(200, count - start - 1)):
+                self.callees[start + depth].append(start + depth + 1)
+
+        # Recursive cycles: self-recursion and mutual recursion.
+        for _ in range(max(1, count // 20000)):
+            func = rng.randrange(first_body, count)
+            self.callees[func].append(func)
+            if func + 3 < count:
+                self.callees[func + 3].append(func)
+
+        for caller in range(count):
+            self.callees[caller] = list(dict.fromkeys(self.callees[caller]))
+
+        # Functions that nothing calls statically stand in for callbacks.
+        called = {callee for callees in self.callees for callee in callees}
+        self.callbacks = [func for func in range(first_body, count) if func not in called]
+
+    def _build_scenarios(self, rng, scenario_count):
+        scenarios = []
+        callers = list(range(1 + self.isr_count)) + [rng.randrange(self.function_count) for _ in range(16)]
+        for _ in range(scenario_count):
+            if not self.callbacks:
+                break
+            scenarios.append(sorted({
+                (rng.choice(callers), rng.choice(self.callbacks)) for _ in range(rng.randint(1, 8))
+            }))
+        return scenarios
+
+    def edge_count(self):
+        return sum(len(callees) for callees in self.callees)
+
+    def write(self, out_dir):
+        """Writes the .su/.cgraph tree, the ELF and the scenario files into 'out_dir'."""
+        build_dir = os.path.join(out_dir, "build")
+        for tu_index, first in enumerate(range(0, self.function_count, FUNCTIONS_PER_TU)):
+            tu_dir = os.path.join(build_dir, f"module_{tu_index // 50}")
+            os.makedirs(tu_dir, exist_ok=True)
+            functions = range(first, min(first + FUNCTIONS_PER_TU, self.function_count))
+            self._write_su(os.path.join(tu_dir, f"unit_{tu_index}.su"), f"unit_{tu_index}.c", functions)
+            self._write_cgraph(os.path.join(tu_dir, f"unit_{tu_index}.c.000i.cgraph"), functions)
+
+        scenario_files = []
+        scenario_dir = os.path.join(out_dir, "scenarios")
+        os.makedirs(scenario_dir, exist_ok=True)
+        for index, scenario in enumerate(self.scenarios):
+            filepath = os.path.join(scenario_dir, f"callbacks_{index}.txt")
+            with open(filepath, 'w') as f:
+                f.write("# caller,callee\n")
+                for caller, callee in scenario:
+                    f.write(f"{self.names[caller]},{self.names[callee]}\n")
+            scenario_files.append(filepath)
+
+        elf_file = os.path.join(out_dir, "firmware.elf")
+        self._write_elf(elf_file)
+        return build_dir, elf_file, scenario_files
+
+    def _write_su(self, filepath, source_name, functions):
+        with open(filepath, 'w') as f:
+            for line, func in enumerate(functions, 1):
+                qualifier = "dynamic,bounded" if self.stack_sizes[func] >= 512 else "static"
+                f.write(f"{source_name}:{line * 10}:5:{self.emitted_names[func]}\t{self.stack_sizes[func]}\t{qualifier}\n")
+
+    def _write_cgraph(self, filepath, functions):
+        local_ids = {}
+        for func in functions:
+            local_ids[func] = len(local_ids)
+        for func in functions:
+            for callee in self.callees[func]:
+                local_ids.setdefault(callee, len(local_ids))
+
+        defined = set(functions)
+        lines = [f"Trivially needed symbols: {' '.join(self._node(f, local_ids) for f in functions)}\n\n\n",
+                 "Initial Symbol table:\n\n"]
+        for func in sorted(local_ids, key=local_ids.get, reverse=True):
+            node = self._node(func, local_ids)
+            callers = [self._node(c, local_ids) for c in functions if func in self.callees[c]][:4] \
+                if func not in defined else []
+            lines.append(f"{node} ({self.emitted_names[func]}) @0x{0x7f0000000000 + local_ids[func] * 0x110:x}\n")
+            if func in defined:
+                lines.append("  Type: function definition analyzed\n")
+                lines.append("  Visibility: semantic_interposition public\n")
+                lines.append("  References: \n  Referring: \n  Function flags: body\n")
+                lines.append("  Called by: \n")
+                calls = ' '.join(self._node(callee, local_ids) for callee in self.callees[func])
+                lines.append(f"  Calls: {calls} \n")
+            else:
+                lines.append("  Type: function\n")
+                lines.append("  Visibility: semantic_interposition external public\n")
+                lines.append("  References: \n  Referring: \n  Function flags:\n")
+                lines.append(f"  Called by: {' '.join(callers)} \n")
+                lines.append("  Calls: \n")
+        with open(filepath, 'w') as f:
+            f.writelines(lines)
+
+    def _node(self, func, local_ids):
+        return f"{self.emitted_names[func]}/{local_ids[func]}"
+
+    def _write_elf(self, filepath):
+        """Writes a minimal 32-bit little-endian ARM ELF with a symbol table and a vector table."""
+        def address_of(func):
+            return TEXT_BASE_ADDR + func * FUNCTION_ALIGN_BYTES
+
+        handlers = range(1, 1 + self.isr_count)
+        vector_data = struct.pack("<I", INITIAL_SP_VALUE)
+        vector_data += b"".join(struct.pack("<I", address_of(func) | 1) for func in handlers)
+        vector_data += struct.pack("<I", 0) * 4  # Reserved slots.
+
+        strtab = bytearray(b"\0")
+        symbols = [struct.pack("<IIIBBH", 0, 0, 0, 0, 0, 0)]
+
+        def add_symbol(name, value, size, sym_type, shndx):
+            symbols.append(struct.pack("<IIIBBH", len(strtab), value, size, (STB_GLOBAL << 4) | sym_type, 0, shndx))
+            strtab.extend(name.encode() + b"\0")
+
+        add_symbol(VECTOR_TABLE_NAME, FLASH_BASE_ADDR, len(vector_data), STT_OBJECT, 1)
+        for func, name in enumerate(self.emitted_names):
+            add_symbol(name, address_of(func) | 1, FUNCTION_ALIGN_BYTES, STT_FUNC, 2)
+        symtab = b"".join(symbols)
+
+        section_names = ["", ".isr_vector", ".text", ".symtab", ".strtab", ".shstrtab"]
+        shstrtab = bytearray()
+        name_offsets = []
+        for name in section_names:
+            name_offsets.append(len(shstrtab))
+            shstrtab.extend(name.encode() + b"\0")
+
+        vector_offset = ELF32_HEADER_SIZE
+        symtab_offset = vector_offset + len(vector_data)
+        strtab_offset = symtab_offset + len(symtab)
+        shstrtab_offset = strtab_offset + len(strtab)
+        sh_offset = (shstrtab_offset + len(shstrtab) + 3) & ~3
+        text_size = self.function_count * FUNCTION_ALIGN_BYTES
+
+        # (type, flags, addr, offset, size, link, info, addralign, entsize)
+        sections = [
+            (0, 0, 0, 0, 0, 0, 0, 0, 0),
+            (SHT_PROGBITS, SHF_ALLOC, FLASH_BASE_ADDR, vector_offset, len(vector_data), 0, 0, 4, 0),
+            (SHT_NOBITS, SHF_ALLOC | SHF_EXECINSTR, TEXT_BASE_ADDR, symtab_offset, text_size, 0, 0, 4, 0),
+            (SHT_SYMTAB, 0, 0, symtab_offset, len(symtab), 4, 1, 4, ELF32_SYMBOL_SIZE),
+            (SHT_STRTAB, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0),
+            (SHT_STRTAB, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0),
+        ]
+
+        e_ident = b"\x7fELF" + bytes([1, 1, 1, 0]) + bytes(8)
+        header = e_ident + struct.pack(
+            "<HHIIIIIHHHHHH", 2, EM_ARM, 1, TEXT_BASE_ADDR | 1, 0, sh_offset, 0x05000000,
+            ELF32_HEADER_SIZE, 0, 0, ELF32_SECTION_HEADER_SIZE, len(sections), len(sections) - 1
+        )
+        with open(filepath, 'wb') as f:
+            f.write(header)
+            f.write(vector_data)
+            f.write(symtab)
+            f.write(strtab)
+            f.write(shstrtab)
+            f.write(bytes(sh_offset - f.tell()))
+            for name_offset, section in zip(name_offsets, sections):
+                f.write(struct.pack("<IIIIIIIIII", name_offset, *section))
+
+
+# --- Benchmark Runner ---
+def _timed(phase_times, phase, func, *args):
+    """Runs func(*args) with stdout discarded and records its wall time."""
+    start = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        result = func(*args)
+    phase_times[phase] = phase_times.get(phase, 0.0) + time.perf_counter() - start
+    return result
+
+
+def run_pipeline(build_dir, elf_file, scenario_files, jobs):
+    """
+    Runs the analyzer pipeline once and returns ({phase: seconds}, scenario_times, worst_stack).
+
+    The phases follow the numbered steps of stack_analyzer.main().
+    """
+    phase_times = {}
+    stack_usage = _timed(phase_times, "su_parse", stack_analyzer.parse_su_files, [build_dir], False, jobs)
+    call_graph, _, _ = _timed(phase_times, "cgraph_parse", stack_analyzer.build_base_call_graph_from_cgraph,
+                              [build_dir], set(), False, jobs)
+    call_graph.load_stack_usage(stack_usage)
+    isrs = _timed(phase_times, "isr_extraction", stack_analyzer.get_isr_entry_points,
+                  elf_file, VECTOR_TABLE_NAME, False)
+    entry_points = sorted(set(isrs) | {"main"})
+
+    def analyze(analysis):
+        worst_stack, worst_path = 0, []
+        for start_func in entry_points:
+            total_stack = analysis.stack_from(start_func)
+            if total_stack > worst_stack:
+                worst_stack, worst_path = total_stack, analysis.path_from(start_func)
+        if worst_stack == float('inf'):
+            analysis.recursive_cycles(entry_points)
+        return worst_stack, worst_path
+
+    base_analysis = stack_analyzer.WorstCaseAnalysis(call_graph)
+    overall_worst = _timed(phase_times, "base_analysis", analyze, base_analysis)
+
+    scenario_add_sets = {f: stack_analyzer.load_annotation_file(f) for f in scenario_files}
+    scenario_times = []
+    phase_times["scenario_analysis"] = 0.0
+    for add_set in scenario_add_sets.values():
+        scenario_additions = {}
+        for caller, callee in add_set:
+            scenario_additions.setdefault(caller, []).append(callee)
+        before = phase_times["scenario_analysis"]
+        result = _timed(phase_times, "scenario_analysis", lambda: analyze(base_analysis.for_scenario(scenario_additions)))
+        scenario_times.append(phase_times["scenario_analysis"] - before)
+        if result[0] > overall_worst[0]:
+            overall_worst = result
+
+    def report():
+        stack_analyzer._run_uncalled_functions_analysis(stack_usage, call_graph, scenario_add_sets, entry_points)
+        stack_analyzer._print_final_results(overall_worst[0], overall_worst[1], "benchmark", call_graph)
+
+    _timed(phase_times, "reporting", report)
+    return phase_times, scenario_times, overall_worst[0]
+
+
+def run_benchmark(function_count, args):
+    """Generates one workload size, runs the pipeline --repeat times and keeps the best times."""
+    project = SyntheticProject(function_count, args.scenarios, args.isrs, args.seed)
+    work_dir = tempfile.mkdtemp(prefix=f"stack_bench_{format_size(function_count)}_", dir=args.work_dir)
+    try:
+        start = time.perf_counter()
+        build_dir, elf_file, scenario_files = project.write(work_dir)
+        generate_time = time.perf_counter() - start
+
+        best_times, best_scenario_times, worst_stack = None, [], 0
+        for _ in range(args.repeat):
+            phase_times, scenario_times, worst_stack = run_pipeline(build_dir, elf_file, scenario_files, args.jobs)
+            if best_times is None:
+                best_times, best_scenario_times = phase_times, scenario_times
+            else:
+                best_times = {phase: min(best_times[phase], phase_times[phase]) for phase in best_times}
+                best_scenario_times = [min(a, b) for a, b in zip(best_scenario_times, scenario_times)]
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            print(f"   Kept workload in: {work_dir}")
+
+    return {
+        "functions": function_count,
+        "edges": project.edge_count(),
+        "scenarios": len(project.scenarios),
+        "isrs": project.isr_count,
+        "worst_stack": worst_stack if worst_stack != float('inf') else "inf",
+        "generate_seconds": round(generate_time, 6),
+        "phases": {phase: round(best_times[phase], 6) for phase in PHASES},
+        "total_seconds": round(sum(best_times.values()), 6),
+        "scenario_seconds": {
+            "mean": round(sum(best_scenario_times) / len(best_scenario_times), 6) if best_scenario_times else 0.0,
+            "max": round(max(best_scenario_times), 6) if best_scenario_times else 0.0,
+        },
+    }
+
+
+# --- Reporting Functions ---
+def _print_results_table(results):
+    header = f"{'size':>6} {'edges':>9} " + " ".join(f"{phase:>17}" for phase in PHASES) + f" {'total':>9}"
+    print(header)
+    print("-" * len(header))
+    for size, result in results.items():
+        phases = " ".join(f"{result['phases'][phase]:>17.4f}" for phase in PHASES)
+        print(f"{size:>6} {result['edges']:>9} {phases} {result['total_seconds']:>9.4f}")
+
+
+def compare_reports(report, baseline, threshold):
+    """Prints per-phase ratios against a baseline report; returns the list of regressions."""
+    regressions = []
+    print(f"\n--- Comparison against baseline (regression threshold: x{threshold:.2f}) ---")
+    for size, result in report["results"].items():
+        baseline_result = baseline.get("results", {}).get(size)
+        if baseline_result is None:
+            print(f"  {size}: not in baseline, skipped")
+            continue
+        for phase in PHASES + ("total",):
+            current = result["total_seconds"] if phase == "total" else result["phases"][phase]
+            previous = baseline_result["total_seconds"] if phase == "total" else baseline_result["phases"].get(phase)
+            if not previous:
+                continue
+            ratio = current / previous
+            is_regression = ratio > threshold and current - previous > REGRESSION_MIN_DELTA_SECONDS
+            color = COLOR_RED if is_regression else COLOR_GREEN if ratio < 1 else ""
+            print(f"  {size:>6} {phase:<18} {previous:>10.4f}s -> {current:>10.4f}s  {color}x{ratio:.2f}{COLOR_RESET}")
+            if is_regression:
+                regressions.append((size, phase, ratio))
+    return regressions
+
+
+def main():
+    """Main execution function."""
+    parser = argparse.ArgumentParser(
+        description="Synthetic-workload benchmark for stack_analyzer.py.",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--sizes', default="1k,10k,100k",
+                        help="Comma-separated function counts to benchmark, e.g. 1k,10k,100k,1m.")
+    parser.add_argument('--scenarios', type=int, default=20, help="Number of --add-calls scenario files.")
+    parser.add_argument('--isrs', type=int, default=64, help="Number of ISRs in the vector table.")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per size; the best time of each phase is kept.")
+    parser.add_argument('--jobs', '-j', type=int, default=1, help="--jobs passed to the parsers.")
+    parser.add_argument('--seed', type=int, default=1, help="Random seed of the generator.")
+    parser.add_argument('--work-dir', help="Directory for the generated workloads (default: system temp).")
+    parser.add_argument('--keep', action='store_true', help="Keep the generated workloads.")
+    parser.add_argument('--output', help="Write the JSON report to this file.")
+    parser.add_argument('--compare', help="Baseline JSON report to compare against.")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="Slowdown ratio over the baseline reported as a regression (default: 1.2).")
+    args = parser.parse_args()
+
+    sizes = [parse_size(size) for size in args.sizes.split(',') if size.strip()]
+    if not sizes or min(sizes) < 2 or args.repeat < 1:
+        parser.error("--sizes needs function counts of at least 2, and --repeat must be positive.")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "jobs": args.jobs,
+        "seed": args.seed,
+        "results": {},
+    }
+    for function_count in sizes:
+        size = format_size(function_count)
+        print(f"Benchmarking {size} functions...")
+        report["results"][size] = run_benchmark(function_count, args)
+
+    print()
+    _print_results_table(report["results"])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to: {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{COLOR_RED}[Error] {len(regressions)} phase(s) regressed beyond x{args.threshold:.2f}.{COLOR_RESET}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()